@@ -0,0 +1,101 @@
+"""Per-call logging overhead of the MCP tools.
+
+Runs the same in-process tool workload under three logging setups, each in a
+fresh interpreter because logging is configured at import time:
+
+  legacy      DEBUG level, synchronous file + stderr handlers, SQL tracing
+              (what main.py did with DEBUG = True)
+  debug       EXPENSE_TRACKER_LOG_LEVEL=DEBUG through the queue listener
+  production  default configuration (ERROR level, queue listener, no tracing)
+
+Usage: python benchmarks/bench_logging.py [--calls 2000]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+MODES = {
+    "legacy": {"EXPENSE_TRACKER_LOG_LEVEL": "DEBUG", "EXPENSE_TRACKER_TRACE": "1"},
+    "debug": {"EXPENSE_TRACKER_LOG_LEVEL": "DEBUG"},
+    "production": {},
+}
+
+
+def use_legacy_handlers(log_file):
+    '''Swap the queue handler for the synchronous handlers the old main.py installed.'''
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+    for handler in (logging.FileHandler(log_file), logging.StreamHandler(sys.stderr)):
+        handler.setFormatter(formatter)
+        root.addHandler(handler)
+
+
+async def measure(mcp, calls):
+    from fastmcp import Client
+
+    results = {}
+    async with Client(mcp) as client:
+        workload = {
+            "add_expense": {"date": "2024-05-01", "amount": 9.99, "category": "food", "note": "bench"},
+            "get_all_expenses": {"limit": 10},
+            "delete_expense_by_date_and_title": {"date": "2024-05-02", "title": "missing"},
+        }
+        for tool, args in workload.items():
+            await client.call_tool(tool, args)  # warm up
+            start = time.perf_counter()
+            for _ in range(calls):
+                await client.call_tool(tool, args)
+            results[tool] = round((time.perf_counter() - start) / calls * 1e6, 1)
+    return results
+
+
+def run_mode(mode, calls):
+    '''Child process: import the server under the current environment and time the tools.'''
+    sys.path.insert(0, str(ROOT))
+    import main
+
+    if mode == "legacy":
+        use_legacy_handlers(os.environ["EXPENSE_TRACKER_LOG_FILE"])
+    print(json.dumps(asyncio.run(measure(main.mcp, calls))))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=2000, help="calls per tool and mode")
+    parser.add_argument("--mode", choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        run_mode(args.mode, args.calls)
+        return
+
+    report = {"calls_per_tool": args.calls, "us_per_call": {}}
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode, env in MODES.items():
+            child_env = {
+                **{k: v for k, v in os.environ.items() if not k.startswith("EXPENSE_TRACKER_")},
+                **env,
+                "EXPENSE_TRACKER_DB": os.path.join(tmp, f"{mode}.db"),
+                "EXPENSE_TRACKER_LOG_FILE": os.path.join(tmp, f"{mode}.log"),
+            }
+            out = subprocess.run(
+                [sys.executable, __file__, "--mode", mode, "--calls", str(args.calls)],
+                env=child_env, cwd=tmp, check=True, capture_output=True, text=True,
+            ).stdout
+            report["us_per_call"][mode] = json.loads(out.strip().splitlines()[-1])
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
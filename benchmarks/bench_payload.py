@@ -0,0 +1,170 @@
+"""Response size and encode time of the full and compact response formats.
+
+Builds a synthetic ledger and, for each listing page size and response
+variant, measures:
+
+  bytes       the response as the server serializes it (pydantic_core.to_json,
+              what FastMCP puts in a tool result's text content)
+  build_ms    fetching and encoding the page rows (paginate)
+  encode_ms   serializing the response to JSON
+  call_ms     p50 of the whole tool call through the in-process FastMCP client
+
+Analytics tools are measured the same way through the client with a warm
+cache, so call_ms is mostly response conversion and serialization.
+
+Usage: python benchmarks/bench_payload.py [--rows 100k] [--limits 100,1000] [--output payload.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import pydantic_core
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from benchmarks.ledger import build_ledger, parse_size  # noqa: E402
+
+# Tool arguments of each response variant; analytics tools take no omit_empty
+VARIANTS = {
+    "full": {},
+    "compact": {"response_format": "compact"},
+    "compact_omit_empty": {"response_format": "compact", "omit_empty": True},
+    "compact_rounded": {"response_format": "compact", "omit_empty": True, "decimals": 0},
+}
+
+LISTING_TOOLS = {
+    "get_all_expenses": {},
+    "get_expenses_by_category": {"category": "food"},
+    "search_expenses": {"query": "lunch OR coffee"},
+}
+
+ANALYTICS_TOOLS = {
+    "get_category_totals": {},
+    "get_spending_trends": {"granularity": "month", "count": 24},
+    "analyze_snapshot": {"group_by": ["month", "category"], "limit": 1000},
+}
+
+
+def to_json(value):
+    return pydantic_core.to_json(value, fallback=str)
+
+
+def median_ms(samples):
+    return round(statistics.median(samples) * 1000, 3)
+
+
+def measure_paginate(db, limits, repeat):
+    '''build_ms, encode_ms and bytes of paginate() pages for every limit and variant.'''
+    from src.compact import parse_format
+    from src.pagination import paginate
+
+    conn = sqlite3.connect(db)
+    conn.row_factory = sqlite3.Row
+    report = {}
+    for limit in limits:
+        report[limit] = {}
+        for variant, args in VARIANTS.items():
+            fmt = parse_format(args.get("response_format"), args.get("decimals"), args.get("omit_empty", False))
+            build, encode = [], []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                page = paginate(conn, limit=limit, fmt=fmt)
+                built = time.perf_counter()
+                payload = to_json({"status": "ok", **page})
+                build.append(built - start)
+                encode.append(time.perf_counter() - built)
+            report[limit][variant] = {
+                "bytes": len(payload),
+                "build_ms": median_ms(build),
+                "encode_ms": median_ms(encode),
+            }
+    conn.close()
+    return report
+
+
+async def measure_calls(limits, repeat):
+    '''bytes and call_ms of the listing and analytics tools through the FastMCP client.'''
+    import main
+    from fastmcp import Client
+
+    async def timed(client, tool, args):
+        samples = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = await client.call_tool(tool, args, raise_on_error=False)
+            samples.append(time.perf_counter() - start)
+        if result.is_error or result.structured_content.get("status") == "error":
+            return {"error": str(result.structured_content or result.content)}
+        return {"bytes": len(to_json(result.structured_content)), "call_ms": median_ms(samples)}
+
+    report = {}
+    async with Client(main.mcp) as client:
+        for tool, base in LISTING_TOOLS.items():
+            for limit in limits:
+                report[f"{tool}[{limit}]"] = {
+                    variant: await timed(client, tool, {**base, "limit": limit, **args})
+                    for variant, args in VARIANTS.items()
+                }
+        snapshot = await client.call_tool("export_snapshot", {}, raise_on_error=False)
+        for tool, base in ANALYTICS_TOOLS.items():
+            if tool == "analyze_snapshot" and snapshot.structured_content.get("status") != "ok":
+                report[tool] = {"skipped": snapshot.structured_content.get("message")}
+                continue
+            await client.call_tool(tool, base, raise_on_error=False)  # fill the cache
+            report[tool] = {
+                variant: await timed(client, tool, {**base, **{k: v for k, v in args.items() if k != "omit_empty"}})
+                for variant, args in VARIANTS.items()
+                if variant != "compact_omit_empty"
+            }
+    return report
+
+
+def add_ratios(results):
+    '''bytes of every variant relative to the full format.'''
+    for variants in results.values():
+        full = variants.get("full", {}).get("bytes")
+        for stats in variants.values():
+            if full and "bytes" in stats:
+                stats["size_vs_full"] = round(stats["bytes"] / full, 3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=parse_size, default=parse_size("100k"), help="ledger size, e.g. 10k, 1m")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--limits", default="100,1000", help="comma-separated page sizes")
+    parser.add_argument("--repeat", type=int, default=20, help="timed calls per measurement")
+    parser.add_argument("--output", help="write the JSON report to this file")
+    args = parser.parse_args()
+    limits = [int(limit) for limit in args.limits.split(",")]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Path(tmp) / "expense.db"
+        build_ledger(db, args.rows, args.seed)
+        # The server reads its configuration at import, so set it before measure_calls imports main
+        os.environ["EXPENSE_TRACKER_DB"] = str(db)
+        os.environ["EXPENSE_TRACKER_LOG_FILE"] = str(Path(tmp) / "bench.log")
+
+        paginate_report = measure_paginate(db, limits, args.repeat)
+        calls_report = asyncio.run(measure_calls(limits, args.repeat))
+
+    add_ratios(paginate_report)
+    add_ratios(calls_report)
+
+    report = {"rows": args.rows, "repeat": args.repeat, "paginate": paginate_report, "tools": calls_report}
+    text = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(text + "\n", encoding="utf-8")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
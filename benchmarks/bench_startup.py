@@ -0,0 +1,131 @@
+"""Server startup cost, as seen by an MCP client that spawns the server per session.
+
+Measures, each in fresh interpreters against a temp database:
+
+  import        time to `import main` and whether it touched the database file
+  modules       self import time of this project's own modules (python -X importtime)
+  spawn         stdio launch + MCP initialize, list_tools and the first two tool
+                calls, for a new database file and for an existing one
+
+Usage: python benchmarks/bench_startup.py [--runs 5]
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+IMPORT_SNIPPET = (
+    "import time; start = time.perf_counter(); import main; "
+    "print(time.perf_counter() - start)"
+)
+
+
+def summary(samples):
+    return {
+        "runs": len(samples),
+        "mean_ms": round(statistics.fmean(samples) * 1000, 1),
+        "min_ms": round(min(samples) * 1000, 1),
+        "max_ms": round(max(samples) * 1000, 1),
+    }
+
+
+def server_env(db_path, log_dir):
+    env = {k: v for k, v in os.environ.items() if not k.startswith("EXPENSE_TRACKER_")}
+    env.update(EXPENSE_TRACKER_DB=str(db_path), EXPENSE_TRACKER_LOG_FILE=str(Path(log_dir) / "server.log"),
+               FASTMCP_SHOW_CLI_BANNER="false")
+    return env
+
+
+def measure_import(runs, tmp):
+    samples = []
+    touched = False
+    for n in range(runs):
+        db = Path(tmp) / f"import-{n}.db"
+        out = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET], cwd=ROOT, env=server_env(db, tmp),
+                             capture_output=True, text=True, check=True).stdout
+        samples.append(float(out.strip().splitlines()[-1]))
+        touched = touched or db.exists()
+    return {**summary(samples), "database_touched": touched}
+
+
+def measure_modules(tmp):
+    '''Self import time of main and src.* modules, largest first.'''
+    stderr = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"], cwd=ROOT,
+                            env=server_env(Path(tmp) / "importtime.db", tmp),
+                            capture_output=True, text=True, check=True).stderr
+    own = {}
+    total_us = 0
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        parts = [part.strip() for part in line[len("import time:"):].split("|")]
+        if not parts[0].isdigit():
+            continue
+        total_us = max(total_us, int(parts[1]))
+        name = parts[2]
+        if name == "main" or name.startswith("src"):
+            own[name] = int(parts[0])
+    return {
+        "total_ms": round(total_us / 1000, 1),
+        "own_modules_ms": round(sum(own.values()) / 1000, 1),
+        "own_modules": {name: round(us / 1000, 2) for name, us in sorted(own.items(), key=lambda kv: -kv[1])},
+    }
+
+
+async def spawn_once(db, tmp):
+    from fastmcp import Client
+    from fastmcp.client.transports import PythonStdioTransport
+
+    transport = PythonStdioTransport(ROOT / "main.py", env=server_env(db, tmp), cwd=str(ROOT),
+                                     python_cmd=sys.executable, keep_alive=False)
+    timings = {}
+    start = time.perf_counter()
+    async with Client(transport) as client:
+        timings["initialize"] = time.perf_counter() - start
+        mark = time.perf_counter()
+        await client.list_tools()
+        timings["list_tools"] = time.perf_counter() - mark
+        for label in ("first_call", "second_call"):
+            mark = time.perf_counter()
+            await client.call_tool("get_all_expenses", {"limit": 10})
+            timings[label] = time.perf_counter() - mark
+    timings["total"] = time.perf_counter() - start
+    return timings
+
+
+def measure_spawn(runs, tmp):
+    report = {}
+    for scenario in ("new_database", "existing_database"):
+        samples = {}
+        for n in range(runs):
+            db = Path(tmp) / ("spawn.db" if scenario == "existing_database" else f"spawn-new-{n}.db")
+            for key, value in asyncio.run(spawn_once(db, tmp)).items():
+                samples.setdefault(key, []).append(value)
+        report[scenario] = {key: summary(values) for key, values in samples.items()}
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters per measurement")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        report = {
+            "import": measure_import(args.runs, tmp),
+            "modules": measure_modules(tmp),
+            "spawn": measure_spawn(args.runs, tmp),
+        }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
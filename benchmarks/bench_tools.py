@@ -0,0 +1,308 @@
+"""Benchmark every registered tool against synthetic ledgers.
+
+For each ledger size a fresh interpreter serves the tools in-process through
+the FastMCP client and runs two phases:
+
+  tools   each tool called sequentially with representative arguments
+          (the analytics cache is cleared before every call unless --warm-cache)
+  mixed   --concurrency workers issuing a read/write mix for --duration seconds
+
+Latency percentiles, throughput and the serving process's peak RSS are
+printed (or written with --output) as JSON so runs can be diffed between
+commits. Everything runs offline; ledgers are generated by ledger.py.
+
+Usage: python benchmarks/bench_tools.py --sizes 10k,1m [--output before.json]
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from benchmarks.ledger import CATEGORIES, END_DATE, build_ledger, parse_size  # noqa: E402
+
+# Calls per tool in the sequential phase; slow maintenance tools get fewer
+DEFAULT_ITERATIONS = 50
+MAX_CALLS = {"verify_rollups": 3, "import_expenses": 3, "rebuild_search_index": 3, "export_snapshot": 3,
+             "add_recurring_expense": 10}
+
+# Run before the rest because other tools read what they produce
+RUN_FIRST = ("export_snapshot", "set_budget")
+
+# Share of writes in the mixed workload
+WRITE_RATIO = 0.2
+
+IMPORT_ROWS = 1000
+
+
+def percentiles(samples):
+    '''Latency summary in milliseconds (nearest-rank percentiles).'''
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def pick(q):
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 3)
+
+    return {
+        "count": len(ordered),
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 3),
+        "p50_ms": pick(0.50),
+        "p95_ms": pick(0.95),
+        "p99_ms": pick(0.99),
+        "max_ms": round(ordered[-1] * 1000, 3),
+    }
+
+
+def random_day(rng):
+    return (END_DATE - datetime.timedelta(days=rng.randrange(3 * 365))).isoformat()
+
+
+def random_month(rng):
+    return random_day(rng)[:7]
+
+
+def budget_month(rng):
+    year, month = random_month(rng).split("-")
+    return {"year": int(year), "month": int(month)}
+
+
+def new_expense(rng):
+    category = rng.choice(list(CATEGORIES))
+    return {"date": random_day(rng), "amount": round(rng.uniform(1, 200), 2),
+            "category": category, "note": "benchmark"}
+
+
+def tool_workloads(import_file):
+    '''tool name -> function(rng) returning the call arguments.'''
+    return {
+        "add_expense": new_expense,
+        "get_all_expenses": lambda rng: {"limit": 100},
+        "get_expenses_by_category": lambda rng: {"category": rng.choice(list(CATEGORIES)), "limit": 100},
+        "get_expenses_by_date_range": lambda rng: {"start_date": random_month(rng) + "-01",
+                                                   "end_date": random_month(rng) + "-28", "limit": 100},
+        "delete_expense_by_date_and_title": lambda rng: {"date": random_day(rng), "title": "no such note"},
+        "get_expense_summary": lambda rng: {"period": rng.choice(["all", random_month(rng), random_day(rng)[:4]])},
+        "get_monthly_spending": budget_month,
+        "get_category_totals": lambda rng: {"period": rng.choice(["all", random_month(rng)])},
+        "get_spending_trends": lambda rng: rng.choice([{"period1": random_month(rng), "period2": random_month(rng)},
+                                                       {"granularity": "month", "count": 12, "end": random_day(rng)}]),
+        "get_top_categories": lambda rng: {"limit": 5, "period": random_day(rng)[:4]},
+        "search_expenses": lambda rng: {"query": rng.choice(["coffee", "week*", '"monthly bill"', "gift OR holiday"]),
+                                        "limit": 20},
+        "rebuild_search_index": lambda rng: {},
+        "delete_expenses": lambda rng: {"category": rng.choice(list(CATEGORIES)), "start_date": random_month(rng) + "-01",
+                                        "end_date": random_month(rng) + "-28", "dry_run": True},
+        "update_expenses": lambda rng: {"category": rng.choice(list(CATEGORIES)), "start_date": random_month(rng) + "-01",
+                                        "end_date": random_month(rng) + "-28", "set_note": "benchmark"},
+        "verify_rollups": lambda rng: {"repair": False},
+        "export_snapshot": lambda rng: {},
+        "set_budget": lambda rng: {"category": rng.choice(list(CATEGORIES)), "monthly_amount": round(rng.uniform(100, 2000), 2)},
+        "remove_budget": lambda rng: {"category": "no such category"},
+        "get_budget_status": budget_month,
+        "add_recurring_expense": lambda rng: {"amount": round(rng.uniform(5, 100), 2), "category": rng.choice(list(CATEGORIES)),
+                                              "start_date": random_day(rng), "note": "benchmark"},
+        "list_recurring_expenses": lambda rng: {},
+        "cancel_recurring_expense": lambda rng: {"id": 0},
+        "materialize_recurring_expenses": lambda rng: {},
+        "analyze_snapshot": lambda rng: {"group_by": rng.choice([["category"], ["category", "month"], ["year", "weekday"]]),
+                                         "start_date": random_month(rng) + "-01"},
+        "import_expenses": lambda rng: {"path": str(import_file), "format": "csv"},
+        "get_cache_stats": lambda rng: {},
+        "get_server_metrics": lambda rng: {"top": 5},
+        "aggregate_ledgers": lambda rng: {"period": rng.choice(["all", random_month(rng), random_day(rng)[:4]])},
+    }
+
+
+MIXED_READS = ("get_all_expenses", "get_expenses_by_date_range", "get_expense_summary",
+               "get_category_totals", "get_top_categories", "search_expenses")
+MIXED_WRITES = ("add_expense",)
+
+
+def write_import_file(path, rng):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("date,amount,category,subcategory,note\n")
+        for _ in range(IMPORT_ROWS):
+            row = new_expense(rng)
+            f.write(f"{row['date']},{row['amount']},{row['category']},,{row['note']}\n")
+
+
+def is_error(result):
+    data = result.structured_content or {}
+    return result.is_error or (isinstance(data, dict) and data.get("status") == "error")
+
+
+async def timed_call(client, tool, args):
+    start = time.perf_counter()
+    result = await client.call_tool(tool, args, raise_on_error=False)
+    return time.perf_counter() - start, is_error(result)
+
+
+async def run_tools(client, workloads, iterations, warm_cache, rng):
+    from src.cache import result_cache
+
+    report = {}
+    for tool in sorted(workloads, key=lambda name: (name not in RUN_FIRST, name)):
+        make_args = workloads[tool]
+        samples, errors = [], 0
+        for _ in range(min(iterations, MAX_CALLS.get(tool, iterations))):
+            if not warm_cache:
+                result_cache.invalidate()
+            elapsed, failed = await timed_call(client, tool, make_args(rng))
+            samples.append(elapsed)
+            errors += failed
+        report[tool] = {"errors": errors, **percentiles(samples)}
+    return report
+
+
+async def run_mixed(client, workloads, concurrency, duration, seed):
+    samples = {"read": [], "write": []}
+    errors = 0
+    deadline = time.perf_counter() + duration
+
+    async def worker(n):
+        nonlocal errors
+        rng = random.Random(seed + n)
+        while time.perf_counter() < deadline:
+            kind = "write" if rng.random() < WRITE_RATIO else "read"
+            tool = rng.choice(MIXED_WRITES if kind == "write" else MIXED_READS)
+            elapsed, failed = await timed_call(client, tool, workloads[tool](rng))
+            samples[kind].append(elapsed)
+            errors += failed
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(n) for n in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    total = len(samples["read"]) + len(samples["write"])
+    return {
+        "concurrency": concurrency,
+        "duration_s": round(elapsed, 2),
+        "ops": total,
+        "ops_per_s": round(total / elapsed, 1),
+        "errors": errors,
+        "read": percentiles(samples["read"]),
+        "write": percentiles(samples["write"]),
+    }
+
+
+async def serve_and_measure(args, workdir):
+    import main
+    from fastmcp import Client
+
+    rng = random.Random(args.seed)
+    import_file = Path(workdir) / "import.csv"
+    write_import_file(import_file, rng)
+    workloads = tool_workloads(import_file)
+
+    async with Client(main.mcp) as client:
+        registered = sorted(t.name for t in await client.list_tools())
+        start = time.perf_counter()
+        tools = await run_tools(client, {t: workloads[t] for t in registered if t in workloads},
+                                args.iterations, args.warm_cache, rng)
+        tools_elapsed = time.perf_counter() - start
+        calls = sum(stats["count"] for stats in tools.values())
+        mixed = await run_mixed(client, workloads, args.concurrency, args.duration, args.seed)
+
+    return {
+        "tools": tools,
+        "tools_calls_per_s": round(calls / tools_elapsed, 1),
+        "untested_tools": [t for t in registered if t not in workloads],
+        "mixed": mixed,
+    }
+
+
+def run_child(args):
+    '''Child process: serve the ledger named by EXPENSE_TRACKER_DB and print the report.'''
+    workdir = os.path.dirname(os.environ["EXPENSE_TRACKER_DB"])
+    report = asyncio.run(serve_and_measure(args, workdir))
+    report["peak_rss_mib"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    print(json.dumps(report))
+
+
+def prepare_ledger(rows, seed, ledger_dir, target):
+    '''Build (or reuse from ledger_dir) a pristine ledger and copy it to target.'''
+    if ledger_dir is None:
+        start = time.perf_counter()
+        build_ledger(target, rows, seed)
+        return time.perf_counter() - start
+    cached = Path(ledger_dir) / f"ledger-{rows}-{seed}.db"
+    start = time.perf_counter()
+    if not cached.exists():
+        Path(ledger_dir).mkdir(parents=True, exist_ok=True)
+        build_ledger(cached, rows, seed)
+    shutil.copyfile(cached, target)
+    return time.perf_counter() - start
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10k", help="comma-separated ledger sizes, e.g. 10k,1m,10m")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--iterations", type=int, default=DEFAULT_ITERATIONS, help="calls per tool")
+    parser.add_argument("--concurrency", type=int, default=8, help="workers in the mixed workload")
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds of mixed workload")
+    parser.add_argument("--warm-cache", action="store_true", help="keep the analytics cache between calls")
+    parser.add_argument("--ledger-dir", help="keep generated ledgers here and reuse them on later runs")
+    parser.add_argument("--output", help="write the JSON report to this file")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args)
+        return
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "settings": {k: getattr(args, k) for k in ("seed", "iterations", "concurrency", "duration", "warm_cache")},
+        "results": {},
+    }
+    for size in args.sizes.split(","):
+        rows = parse_size(size)
+        with tempfile.TemporaryDirectory() as tmp:
+            db = Path(tmp) / "expense.db"
+            setup_s = prepare_ledger(rows, args.seed, args.ledger_dir, db)
+            env = {k: v for k, v in os.environ.items() if not k.startswith("EXPENSE_TRACKER_")}
+            env.update(EXPENSE_TRACKER_DB=str(db), EXPENSE_TRACKER_LOG_FILE=str(Path(tmp) / "bench.log"))
+            child = subprocess.run(
+                [sys.executable, __file__, "--child", *sys.argv[1:]],
+                env=env, cwd=tmp, capture_output=True, text=True,
+            )
+            if child.returncode:
+                sys.exit(f"Benchmark for {size} failed:\n{child.stderr}")
+            result = json.loads(child.stdout.strip().splitlines()[-1])
+        report["results"][size] = {"rows": rows, "ledger_setup_s": round(setup_s, 2), **result}
+        print(f"{size}: done", file=sys.stderr)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(text + "\n", encoding="utf-8")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""Synthetic ledger generator for benchmarks.
+
+Writes a reproducible expense database with realistic skew: a few categories
+dominate (Zipf-like weights), recent months and weekends are busier, amounts
+are log-normal per category and about a third of the notes are empty.
+
+Usage: python benchmarks/ledger.py 1m /tmp/ledger.db [--seed 42]
+Sizes accept plain integers or k/m suffixes (10k, 1m, 10m).
+"""
+import argparse
+import datetime
+import random
+import sqlite3
+import sys
+import time
+from itertools import accumulate
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from src.db import INSERT_EXPENSE, migrate, rebuild_rollups  # noqa: E402
+from src.search import rebuild_search_index  # noqa: E402
+
+# category -> (median amount, subcategories, notes)
+CATEGORIES = {
+    "food": (12.0, ["groceries", "restaurant", "coffee", "delivery"], ["lunch", "dinner", "weekly shop", "snacks"]),
+    "transport": (8.0, ["fuel", "metro", "taxi", "parking"], ["commute", "airport", "trip"]),
+    "shopping": (35.0, ["clothes", "electronics", "home"], ["gift", "sale", "online order"]),
+    "utilities": (60.0, ["electricity", "water", "internet", "phone"], ["monthly bill"]),
+    "entertainment": (20.0, ["movies", "games", "streaming", "concerts"], ["weekend", "subscription"]),
+    "health": (40.0, ["pharmacy", "doctor", "gym"], ["prescription", "checkup", "membership"]),
+    "rent": (900.0, [""], ["monthly rent"]),
+    "travel": (150.0, ["flights", "hotel", "tours"], ["holiday", "conference"]),
+    "education": (45.0, ["books", "courses"], ["online course", "textbook"]),
+    "gifts": (30.0, ["birthday", "holiday"], ["family", "friends"]),
+    "insurance": (110.0, ["car", "health", "home"], ["premium"]),
+    "charity": (25.0, [""], ["donation"]),
+}
+
+# Days of history ending at END_DATE (fixed so ledgers are reproducible)
+HISTORY_DAYS = 3 * 365
+END_DATE = datetime.date(2025, 12, 31)
+
+BATCH_SIZE = 50_000
+
+
+def parse_size(text):
+    text = text.strip().lower()
+    scale = {"k": 1_000, "m": 1_000_000}.get(text[-1:], 1)
+    return int(float(text[:-1] if scale > 1 else text) * scale)
+
+
+def _date_weights():
+    '''Dates in the history window and their relative frequency.'''
+    dates, weights = [], []
+    for offset in range(HISTORY_DAYS):
+        day = END_DATE - datetime.timedelta(days=HISTORY_DAYS - 1 - offset)
+        weight = 1.0 + 2.0 * offset / HISTORY_DAYS  # spending grows towards the present
+        if day.weekday() >= 5:
+            weight *= 1.6
+        if day.day == 1:
+            weight *= 2.5  # bills and rent
+        dates.append(day.isoformat())
+        weights.append(weight)
+    return dates, list(accumulate(weights))
+
+
+def generate_rows(rows, seed=42):
+    '''Yield batches of expense tuples in INSERT_EXPENSE column order.'''
+    rng = random.Random(seed)
+    names = list(CATEGORIES)
+    category_weights = list(accumulate(1 / (rank + 1) ** 1.1 for rank in range(len(names))))
+    dates, date_weights = _date_weights()
+
+    remaining = rows
+    while remaining > 0:
+        size = min(BATCH_SIZE, remaining)
+        remaining -= size
+        batch = []
+        for day, category in zip(rng.choices(dates, cum_weights=date_weights, k=size),
+                                 rng.choices(names, cum_weights=category_weights, k=size)):
+            median, subcategories, notes = CATEGORIES[category]
+            cents = round(median * rng.lognormvariate(0, 0.6) * 100)
+            note = rng.choice(notes) if rng.random() < 0.65 else ""
+            batch.append((day, cents / 100, cents, None, category, rng.choice(subcategories), note))
+        yield batch
+
+
+def build_ledger(path, rows, seed=42):
+    '''Create a migrated database at path holding rows synthetic expenses.'''
+    path = Path(path)
+    path.unlink(missing_ok=True)
+    conn = sqlite3.connect(path)
+    try:
+        migrate(conn)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=OFF")
+        conn.execute("BEGIN IMMEDIATE")
+        # Load without secondary indexes and triggers, then rebuild indexes, rollups and search once
+        objects = conn.execute(
+            "SELECT type, name, sql FROM sqlite_master "
+            "WHERE type IN ('index', 'trigger') AND tbl_name = 'expenses' AND sql IS NOT NULL"
+        ).fetchall()
+        for kind, name, _ in objects:
+            conn.execute(f"DROP {kind.upper()} {name}")
+        for batch in generate_rows(rows, seed):
+            conn.executemany(INSERT_EXPENSE, batch)
+        for _, _, sql in objects:
+            conn.execute(sql)
+        rebuild_rollups(conn)
+        rebuild_search_index(conn)
+        conn.commit()
+        conn.execute("ANALYZE")
+    finally:
+        conn.close()
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("rows", type=parse_size, help="number of expenses, e.g. 10k, 1m, 10m")
+    parser.add_argument("path", help="SQLite file to (re)create")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    build_ledger(args.path, args.rows, args.seed)
+    print(f"Wrote {args.rows} expenses to {args.path} in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
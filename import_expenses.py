@@ -0,0 +1,30 @@
+import argparse
+import json
+import logging
+import sys
+
+from src.db import init_db, get_connection
+from src.importer import DEFAULT_BATCH_SIZE, FORMATS, import_expenses
+from src.tools import ledgers
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk import expenses from a CSV or JSONL file")
+    parser.add_argument("path", help="CSV (with a header row) or JSONL file to import")
+    parser.add_argument("--format", choices=FORMATS, help="file format, defaults to the file extension")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="rows per executemany batch")
+    parser.add_argument("--db", help="SQLite database file to import into, instead of a ledger")
+    parser.add_argument("--ledger", help="ledger to import into, created if needed (default: the default ledger)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', stream=sys.stderr)
+
+    db = args.db or ledgers.path(args.ledger)
+    init_db(db)
+    report = import_expenses(get_connection(db), args.path, args.format, args.batch_size)
+    print(json.dumps(report, indent=2))
+    return 0 if report["imported"] or not report["failed"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,38 +1,38 @@
 
+from contextlib import asynccontextmanager
 from fastmcp import FastMCP
-from src.tools import register_tools
-import logging
-import sys
-
-# Setup Debug configuration
-DEBUG = True
-
-def setup_logging():
-    """Setup logging that doesn't interfere with MCP protocol"""
-    if DEBUG:
-        logging.basicConfig(
-            level=logging.DEBUG,
-            format='%(asctime)s - %(levelname)s - %(message)s',
-            handlers=[
-                logging.FileHandler('expense_tracker_debug.log'),
-                logging.StreamHandler(sys.stderr)  # Use stderr instead of stdout
-            ]
-        )
-    else:
-        # Production: only log errors to file
-        logging.basicConfig(
-            level=logging.ERROR,
-            format='%(asctime)s - %(levelname)s - %(message)s',
-            handlers=[
-                logging.FileHandler('expense_tracker_error.log')
-            ]
-        )
+from src.db import pool
+from src.logging_config import setup_logging
+from src.maintenance import BackgroundJobs, backfill_ledgers, run_scheduler
+from src.tools import ledgers, register_tools
+
+def ledger_paths():
+    return [ledgers.path(name) for name in ledgers.names()]
+
+
+background = BackgroundJobs(
+    # Finish converting amounts of older databases to cents in the background, in every ledger
+    lambda: backfill_ledgers(ledger_paths),
+    # Write recurring expenses as they fall due, in every ledger
+    lambda: run_scheduler(ledger_paths),
+)
+
+@asynccontextmanager
+async def lifespan(server):
+    """Keep pooled DB connections and background jobs running while any session is active, stop them after the last one"""
+    pool.open_session()
+    background.open_session()
+    try:
+        yield {}
+    finally:
+        background.release_session()
+        pool.release_session()
 
 
 # Setup logging first
 setup_logging()
 # Create MCP server
-mcp = FastMCP("ExpenseTracker")
+mcp = FastMCP("ExpenseTracker", lifespan=lifespan)
 
 # Register all tools from tools.py
 register_tools(mcp)
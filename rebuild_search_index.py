@@ -0,0 +1,34 @@
+import argparse
+import json
+import logging
+import sys
+
+from src.db import init_db, get_connection
+from src.search import rebuild_search_index
+from src.tools import ledgers
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rebuild the full-text search index over expenses")
+    parser.add_argument("--db", help="SQLite database file to reindex, instead of a ledger")
+    parser.add_argument("--ledger", help="ledger to reindex (default: the default ledger)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', stream=sys.stderr)
+
+    db = args.db or ledgers.path(args.ledger)
+    init_db(db)
+    conn = get_connection(db)
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        indexed = rebuild_search_index(conn)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    print(json.dumps({"indexed": indexed}, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
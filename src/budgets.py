@@ -0,0 +1,83 @@
+from .db import to_amount, to_cents
+
+DEFAULT_ALERT_PERCENT = 80
+
+
+def normalize_budget(category, monthly_amount, alert_percent=DEFAULT_ALERT_PERCENT):
+    '''Validate a budget and return (category, monthly_cents, alert_percent).'''
+    category = str(category or "").strip().lower()
+    if not category:
+        raise ValueError("Category is required")
+    cents = to_cents(monthly_amount)
+    if cents <= 0:
+        raise ValueError("Budget amount must be positive")
+    alert_percent = int(alert_percent)
+    if not 1 <= alert_percent <= 100:
+        raise ValueError("alert_percent must be between 1 and 100")
+    return category, cents, alert_percent
+
+
+def set_budget(conn, category, monthly_cents, alert_percent):
+    conn.execute("""
+        INSERT INTO budgets(category, monthly_cents, alert_percent) VALUES (?, ?, ?)
+        ON CONFLICT(category) DO UPDATE SET
+            monthly_cents = excluded.monthly_cents,
+            alert_percent = excluded.alert_percent
+    """, (category, monthly_cents, alert_percent))
+
+
+def remove_budget(conn, category):
+    return conn.execute("DELETE FROM budgets WHERE category = ?", (category,)).rowcount
+
+
+def _state(spent, budget, alert_percent):
+    if spent > budget:
+        return "over"
+    if spent * 100 >= budget * alert_percent:
+        return "warning"
+    return "ok"
+
+
+def budget_status(conn, month):
+    '''Spending against every budget in month (YYYY-MM).
+
+    Each budget reads its category's rows of expense_rollups for the month, a
+    primary-key range the rollup triggers keep current on every write, so the
+    cost grows with the number of budgets, not with the number of expenses.
+    '''
+    rows = conn.execute("""
+        SELECT b.category, b.monthly_cents, b.alert_percent,
+               COALESCE(SUM(r.total_cents), 0) AS spent_cents,
+               COALESCE(SUM(r.count), 0) AS count
+        FROM budgets b
+        LEFT JOIN expense_rollups r ON r.year_month = ? AND r.category = b.category
+        GROUP BY b.category
+        ORDER BY b.category
+    """, (month,)).fetchall()
+
+    budgets = []
+    for row in rows:
+        spent, budget = row["spent_cents"], row["monthly_cents"]
+        budgets.append({
+            "category": row["category"],
+            "budget": to_amount(budget),
+            "spent": to_amount(spent),
+            "remaining": to_amount(budget - spent),
+            "percent_used": round(spent * 100 / budget, 1),
+            "count": row["count"],
+            "alert_percent": row["alert_percent"],
+            "state": _state(spent, budget, row["alert_percent"]),
+        })
+
+    total_budget = sum(row["monthly_cents"] for row in rows)
+    total_spent = sum(row["spent_cents"] for row in rows)
+    return {
+        "month": month,
+        "total_budget": to_amount(total_budget),
+        "total_spent": to_amount(total_spent),
+        "budgets": budgets,
+        "alerts": [
+            {"category": b["category"], "state": b["state"], "percent_used": b["percent_used"]}
+            for b in budgets if b["state"] != "ok"
+        ],
+    }
@@ -0,0 +1,134 @@
+import json
+import logging
+
+from .db import MINOR_UNITS, normalize_currency, normalize_date, rebuild_rollups, to_cents
+from .search import fts_query
+
+logger = logging.getLogger(__name__)
+
+# Ids listed in a response; the count always covers every match
+MAX_REPORTED_IDS = 1000
+
+# Above this many rows the rollup triggers are suspended and the touched months rebuilt once
+TRIGGER_ROWS = 100
+
+_BY_IDS = "id IN (SELECT value FROM json_each(?))"
+
+
+def expense_filter(ids=None, start_date=None, end_date=None, category=None, subcategory=None,
+                   note=None, search=None):
+    '''SQL predicate and params selecting expenses by ids and/or filters.
+
+    Every filter maps onto an index: ids onto the rowid, dates onto
+    idx_expenses_date, category (+ date) onto idx_expenses_category_date,
+    note + date onto idx_expenses_date_note and search onto expenses_fts.
+    '''
+    conditions = []
+    params = []
+    if ids is not None:
+        if not ids:
+            raise ValueError("ids must not be empty")
+        conditions.append(_BY_IDS)
+        params.append(json.dumps([int(i) for i in ids]))
+    if start_date:
+        conditions.append("date >= ?")
+        params.append(normalize_date(start_date))
+    if end_date:
+        conditions.append("date <= ?")
+        params.append(normalize_date(end_date))
+    if category:
+        conditions.append("category = ?")
+        params.append(category.strip().lower())
+    if subcategory is not None:
+        conditions.append("subcategory = ?")
+        params.append(subcategory.lower())
+    if note is not None:
+        conditions.append("note = ?")
+        params.append(note.lower())
+    if search:
+        conditions.append("id IN (SELECT rowid FROM expenses_fts WHERE expenses_fts MATCH ?)")
+        params.append(fts_query(search))
+    if not conditions:
+        raise ValueError("Give ids or at least one filter (start_date, end_date, category, subcategory, note, search)")
+    return " AND ".join(conditions), params
+
+
+def normalize_changes(date=None, amount=None, category=None, subcategory=None, note=None, currency=None):
+    '''Validate the fields to set and return them as {column: value}.'''
+    changes = {}
+    if date is not None:
+        changes["date"] = normalize_date(date)
+    if amount is not None:
+        cents = to_cents(amount)
+        changes["amount"] = cents / MINOR_UNITS
+        changes["amount_cents"] = cents
+    if category is not None:
+        category = category.strip().lower()
+        if not category:
+            raise ValueError("Category cannot be empty")
+        changes["category"] = category
+    if subcategory is not None:
+        changes["subcategory"] = subcategory.lower()
+    if note is not None:
+        changes["note"] = note.lower()
+    if currency is not None:
+        changes["currency"] = normalize_currency(currency)
+    if not changes:
+        raise ValueError("Nothing to update, give at least one field to set")
+    return changes
+
+
+def _matches(conn, where, params):
+    ids = []
+    months = set()
+    for expense_id, month in conn.execute(f"SELECT id, year_month FROM expenses WHERE {where}", params):
+        ids.append(expense_id)
+        months.add(month)
+    return ids, months
+
+
+def _report(ids, months, dry_run):
+    return {
+        "matched": len(ids),
+        "ids": ids[:MAX_REPORTED_IDS],
+        "ids_truncated": len(ids) > MAX_REPORTED_IDS,
+        "months": sorted(months),
+        "dry_run": dry_run,
+    }
+
+
+def _apply(conn, sql, params, ids, months):
+    bulk = len(ids) > TRIGGER_ROWS
+    if bulk:
+        conn.execute("UPDATE rollup_control SET suspended = 1")
+    conn.execute(sql, params)
+    if bulk:
+        rebuild_rollups(conn, months)
+        conn.execute("UPDATE rollup_control SET suspended = 0")
+
+
+def preview(conn, where, params):
+    '''What delete_matching/update_matching would touch, without writing.'''
+    return _report(*_matches(conn, where, params), dry_run=True)
+
+
+def delete_matching(conn, where, params):
+    '''Delete every expense matching where. Runs inside the caller's transaction.'''
+    ids, months = _matches(conn, where, params)
+    if ids:
+        _apply(conn, f"DELETE FROM expenses WHERE {_BY_IDS}", [json.dumps(ids)], ids, months)
+        logger.info("Deleted %s expenses across %s months", len(ids), len(months))
+    return _report(ids, months, dry_run=False)
+
+
+def update_matching(conn, where, params, changes):
+    '''Apply changes to every expense matching where. Runs inside the caller's transaction.'''
+    ids, months = _matches(conn, where, params)
+    if ids:
+        if "date" in changes:
+            months.add(changes["date"][:7])
+        assignments = ", ".join(f"{column} = ?" for column in changes)
+        _apply(conn, f"UPDATE expenses SET {assignments} WHERE {_BY_IDS}",
+               [*changes.values(), json.dumps(ids)], ids, months)
+        logger.info("Updated %s expenses across %s months", len(ids), len(months))
+    return _report(ids, months, dry_run=False)
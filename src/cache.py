@@ -0,0 +1,178 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+# Defaults for the shared analytics cache
+MAX_ENTRIES = 512
+MAX_BYTES = 8 * 1024 * 1024
+TTL_SECONDS = 300
+
+# Databases watched for writes from other processes, least recently used dropped first.
+# Kept below the writer thread's connections per thread so watching never evicts them.
+MAX_WATCHED = 8
+
+
+def months_in_range(months):
+    '''Expand an inclusive (first, last) YYYY-MM range into every month it covers.'''
+    first, last = months
+    year, month = map(int, first.split("-"))
+    result = []
+    while True:
+        current = f"{year:04d}-{month:02d}"
+        result.append(current)
+        if current >= last:
+            return result
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+class ResultCache:
+    '''In-process LRU/TTL cache for tool results.
+
+    Each entry records the data versions of the months it was computed from
+    (or the global version for "all" periods). Writes bump the versions of the
+    months they touch, so only entries that read those months go stale.
+    Versions are kept per scope (the ledger database a result was read from),
+    so a write to one ledger never invalidates another ledger's results.
+    Resolve relative periods like "monthly" to concrete months before keying.
+
+    Writes from other processes (the import CLI, another server) never call
+    invalidate(). Lookups record their scope in watched(), and the writer
+    thread reports commits by other connections to those databases as
+    writes to unknown months. A scope dropped from watched() is invalidated,
+    as nothing watches it any more.
+    '''
+
+    def __init__(self, max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES, ttl=TTL_SECONDS):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (value, versions, size, expires_at)
+        self._bytes = 0
+        self._epoch = 0              # bumped by writes to an unknown ledger
+        self._epochs = {}            # scope -> bumped by writes to unknown months
+        self._global_versions = {}   # scope -> bumped by every write
+        self._month_versions = {}    # (scope, month) -> version
+        self._watched = OrderedDict()  # scope -> None, most recently looked up last
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "expired": 0, "stale": 0, "invalidations": 0}
+
+    def _versions(self, months, scope):
+        epochs = self._epoch, self._epochs.get(scope, 0)
+        if months is None:
+            return epochs, self._global_versions.get(scope, 0)
+        return epochs, tuple(self._month_versions.get((scope, m), 0) for m in months_in_range(months))
+
+    async def acached(self, key, months, compute, scope=None):
+        '''Return the cached value for key, or await compute(), store and return it.
+
+        months is the (first, last) range the result depends on, or None for all data.
+        scope names the database it was read from. Results with status "error"
+        are returned but not stored.
+        '''
+        scope = _scope(scope)
+        key = (scope, key)
+        hit, value = self._lookup(key, months, scope)
+        if hit:
+            return value
+        versions = value
+        value = await compute()
+        self._store(key, versions, value)
+        return value
+
+    def _lookup(self, key, months, scope):
+        '''Return (True, value) on a hit, else (False, versions to store the computed value under).'''
+        now = time.monotonic()
+        with self._lock:
+            if scope is not None:
+                self._watch(scope)
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, versions, size, expires_at = entry
+                if expires_at <= now:
+                    self._stats["expired"] += 1
+                    self._drop(key)
+                elif versions != self._versions(months, scope):
+                    self._stats["stale"] += 1
+                    self._drop(key)
+                else:
+                    self._entries.move_to_end(key)
+                    self._stats["hits"] += 1
+                    return True, value
+            self._stats["misses"] += 1
+            # Snapshot before computing: a write landing mid-compute leaves the entry stale
+            return False, self._versions(months, scope)
+
+    def _store(self, key, versions, value):
+        if isinstance(value, dict) and value.get("status") == "error":
+            return
+        size = len(json.dumps(value, default=str))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (value, versions, size, time.monotonic() + self.ttl)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self._stats["evictions"] += 1
+
+    def _drop(self, key):
+        self._bytes -= self._entries.pop(key)[2]
+
+    def invalidate(self, months=None, scope=None):
+        '''Record a write to the given YYYY-MM months of scope, or to unknown months when None.
+
+        Without a scope the write could have gone to any database and every entry goes stale.
+        '''
+        with self._lock:
+            self._invalidate(months, _scope(scope))
+
+    def _invalidate(self, months, scope):
+        self._stats["invalidations"] += 1
+        if scope is None:
+            self._epoch += 1
+            self._entries.clear()
+            self._bytes = 0
+            return
+        self._global_versions[scope] = self._global_versions.get(scope, 0) + 1
+        if months is None:
+            self._epochs[scope] = self._epochs.get(scope, 0) + 1
+            return
+        for month in set(months):
+            key = (scope, month)
+            self._month_versions[key] = self._month_versions.get(key, 0) + 1
+
+    def _watch(self, scope):
+        self._watched[scope] = None
+        self._watched.move_to_end(scope)
+        while len(self._watched) > MAX_WATCHED:
+            self._invalidate(None, self._watched.popitem(last=False)[0])
+
+    def watched(self):
+        '''Scopes looked up recently enough to be checked for writes from other processes.'''
+        with self._lock:
+            return list(self._watched)
+
+    def stats(self):
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                **self._stats,
+                "hit_ratio": round(self._stats["hits"] / lookups, 4) if lookups else 0.0,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl,
+            }
+
+
+def _scope(scope):
+    # Callers pass a ledger's Path or the str the writer thread keys it by
+    return None if scope is None else str(scope)
+
+
+# Shared by all analytics tools
+result_cache = ResultCache()
@@ -0,0 +1,117 @@
+from collections import namedtuple
+
+from .db import MINOR_UNITS, to_amount
+
+FORMATS = ("full", "compact")
+
+# Text columns a compact row may leave off its end when they are empty
+OPTIONAL_COLUMNS = ("subcategory", "note")
+
+# How a listing or analytics tool encodes its response
+ResponseFormat = namedtuple("ResponseFormat", "compact decimals omit_empty")
+
+FULL = ResponseFormat(False, None, False)
+
+
+def parse_format(name="full", decimals=None, omit_empty=False):
+    '''Validate a tool's response format arguments.
+
+    decimals and omit_empty only apply to the compact format; the full format
+    is always returned exactly as before.
+    '''
+    name = str(name or "full").strip().lower()
+    if name not in FORMATS:
+        raise ValueError(f"Invalid response format '{name}', expected one of {', '.join(FORMATS)}")
+    if decimals is not None:
+        decimals = int(decimals)
+        if not 0 <= decimals <= 2:
+            raise ValueError("decimals must be between 0 and 2")
+    return ResponseFormat(name == "compact", decimals, bool(omit_empty))
+
+
+def rounder(decimals):
+    '''Function rounding a number to decimals places; 0 gives ints, which encode shorter than 12.0.'''
+    if decimals is None:
+        return lambda value: value
+    if decimals == 0:
+        return round
+    return lambda value: round(value, decimals)
+
+
+def row_encoder(columns, fmt=FULL):
+    '''Function turning the values fetched for columns (amount in cents) into one response row.
+
+    The full format gives a dict per row. The compact format gives a list in
+    columns order, with no dict built per row; omit_empty drops empty trailing
+    subcategory/note values, so rows may be shorter than the columns header.
+    '''
+    amount = columns.index("amount") if "amount" in columns else None
+    if not fmt.compact:
+        def encode(values):
+            row = dict(zip(columns, values))
+            if amount is not None:
+                row["amount"] = to_amount(row["amount"])
+            return row
+        return encode
+
+    keep = len(columns)
+    if fmt.omit_empty:
+        while keep and columns[keep - 1] in OPTIONAL_COLUMNS:
+            keep -= 1
+    width = len(columns)
+    scale = rounder(fmt.decimals)
+
+    def encode(values):
+        row = list(values)
+        if amount is not None and row[amount] is not None:
+            row[amount] = scale(row[amount] / MINOR_UNITS)
+        end = width
+        while end > keep and row[end - 1] in ("", None):
+            end -= 1
+        if end < width:
+            del row[end:]
+        return row
+    return encode
+
+
+def _round_all(value, scale):
+    if isinstance(value, float):
+        return scale(value)
+    if isinstance(value, list):
+        return [_round_all(item, scale) for item in value]
+    return value
+
+
+def table(rows, fmt=FULL):
+    '''{"columns", "rows"} for a list of dicts; columns are every key in first-seen order, missing values null.'''
+    columns = list(dict.fromkeys(key for row in rows for key in row))
+    scale = rounder(fmt.decimals)
+    if fmt.decimals is None:
+        values = [[row.get(column) for column in columns] for row in rows]
+    else:
+        values = [[_round_all(row.get(column), scale) for column in columns] for row in rows]
+    return {"columns": columns, "rows": values}
+
+
+def compact_response(response, fmt=FULL):
+    '''Rewrite every list of objects in a tool response as a table() for the compact format.
+
+    Builds new containers rather than editing response, which may be cached.
+    decimals also rounds the other numbers in the response. The full format
+    is returned unchanged.
+    '''
+    if not fmt.compact:
+        return response
+
+    scale = rounder(fmt.decimals)
+
+    def convert(value):
+        if isinstance(value, dict):
+            return {key: convert(item) for key, item in value.items()}
+        if isinstance(value, list) and value and all(isinstance(item, dict) for item in value):
+            return table(value, fmt)
+        if fmt.decimals is not None:
+            return _round_all(value, scale)
+        return value
+
+    return {**convert(response), "format": "compact"}
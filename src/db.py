@@ -1,14 +1,690 @@
+import atexit
+import datetime
+import decimal
+import logging
 import sqlite3
+import threading
+from collections import OrderedDict
+from pathlib import Path
 
-def init_db(DB_PATH):
-    with sqlite3.connect(DB_PATH) as c:
-        c.execute("""
-            CREATE TABLE IF NOT EXISTS expenses(
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                date TEXT NOT NULL,
-                amount REAL NOT NULL,
-                category TEXT NOT NULL,
-                subcategory TEXT DEFAULT '',
-                note TEXT DEFAULT ''
-            )
-        """)
+from .metrics import connection_factory
+
+logger = logging.getLogger(__name__)
+
+# Pragmas applied once when a connection is opened
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA mmap_size=268435456",   # 256 MiB
+    "PRAGMA cache_size=-65536",     # 64 MiB (negative value is KiB)
+    "PRAGMA temp_store=MEMORY",
+)
+
+# Read-only connections inherit WAL from the writer and only tune their caches
+READONLY_PRAGMAS = (
+    "PRAGMA query_only=ON",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA cache_size=-65536",
+    "PRAGMA temp_store=MEMORY",
+)
+
+# Number of prepared statements kept per connection
+STATEMENT_CACHE_SIZE = 256
+
+# Open connections each thread keeps, least recently used closed first. With
+# one database per ledger this bounds file descriptors (3 per WAL connection)
+# and statement/page cache memory however many ledgers are served.
+MAX_CONNECTIONS_PER_THREAD = 16
+
+# Seconds init_db waits for the write lock while another process migrates the same file
+MIGRATION_TIMEOUT = 600
+
+
+class ConnectionManager:
+    '''Long-lived SQLite connections shared by all tools.
+
+    Every thread gets its own connection per database file, so a connection is
+    only ever used by the thread that opened it. Each thread keeps at most
+    max_per_thread of them and closes its least recently used one to open
+    another. Connections are closed when the last server session ends (or at
+    interpreter exit).
+    '''
+
+    def __init__(self, max_per_thread=MAX_CONNECTIONS_PER_THREAD):
+        self.max_per_thread = max_per_thread
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = set()
+        self._sessions = 0
+        self._opened = 0
+        self._evicted = 0
+
+    def get(self, db_path, readonly=False):
+        '''Return this thread's connection to db_path, opening it on first use.'''
+        key = (str(db_path), readonly)
+        conns = getattr(self._local, "connections", None)
+        if conns is None:
+            conns = self._local.connections = OrderedDict()
+        conn = conns.get(key)
+        if conn is not None:
+            conns.move_to_end(key)
+            return conn
+        while len(conns) >= self.max_per_thread:
+            # Only this thread uses its connections, so the oldest is idle
+            self._evict(*conns.popitem(last=False))
+        conn = conns[key] = self._open(*key)
+        return conn
+
+    def _evict(self, key, conn):
+        logger.debug("Closing least recently used connection to %s", key[0])
+        with self._lock:
+            self._connections.discard(conn)
+            self._evicted += 1
+        try:
+            conn.close()
+        except sqlite3.Error as e:
+            logger.error("Error closing connection: %s", e)
+
+    def _open(self, db_path, readonly=False):
+        init_db(db_path)
+        logger.debug("Opening %sSQLite connection to %s", 'read-only ' if readonly else '', db_path)
+        # check_same_thread is off only so close_all() can run from another
+        # thread; ownership is enforced by the thread-local lookup in get().
+        conn = sqlite3.connect(
+            f"{Path(db_path).resolve().as_uri()}?mode=ro" if readonly else db_path,
+            uri=readonly,
+            cached_statements=STATEMENT_CACHE_SIZE,
+            check_same_thread=False,
+            factory=connection_factory(),
+        )
+        conn.row_factory = sqlite3.Row
+        for pragma in READONLY_PRAGMAS if readonly else CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        with self._lock:
+            self._connections.add(conn)
+            self._opened += 1
+        return conn
+
+    def open_session(self):
+        with self._lock:
+            self._sessions += 1
+
+    def release_session(self):
+        with self._lock:
+            self._sessions = max(self._sessions - 1, 0)
+            last = self._sessions == 0
+        if last:
+            self.close_all()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "open": len(self._connections),
+                "opened": self._opened,
+                "evicted": self._evicted,
+                "max_per_thread": self.max_per_thread,
+            }
+
+    def close_all(self):
+        '''Close every pooled connection. Threads reopen lazily on next use.'''
+        with self._lock:
+            conns, self._connections = self._connections, set()
+            # A fresh thread-local makes every thread reopen on its next get()
+            self._local = threading.local()
+        for conn in conns:
+            try:
+                conn.close()
+            except sqlite3.Error as e:
+                logger.error("Error closing connection: %s", e)
+        logger.debug("Closed %s SQLite connection(s)", len(conns))
+
+
+pool = ConnectionManager()
+atexit.register(pool.close_all)
+
+
+def get_connection(db_path, readonly=False):
+    '''Shared connection for the current thread. Use it as `with conn:` for a transaction.'''
+    return pool.get(db_path, readonly)
+
+
+# Rollup maintenance for one inserted (NEW) or removed (OLD) expense row.
+# Removing the current min/max rescans that group, which idx_expenses_month_category keeps small.
+_ROLLUP_ADD = """
+            INSERT INTO expense_rollups(year_month, category, subcategory, total, count, min_amount, max_amount)
+            VALUES (substr(NEW.date, 1, 7), NEW.category, COALESCE(NEW.subcategory, ''), NEW.amount, 1, NEW.amount, NEW.amount)
+            ON CONFLICT(year_month, category, subcategory) DO UPDATE SET
+                total = total + excluded.total,
+                count = count + 1,
+                min_amount = min(min_amount, excluded.min_amount),
+                max_amount = max(max_amount, excluded.max_amount);
+"""
+_ROLLUP_GROUP = """
+                FROM expenses
+                WHERE year_month = substr(OLD.date, 1, 7) AND category = OLD.category
+                  AND COALESCE(subcategory, '') = COALESCE(OLD.subcategory, '')
+"""
+_ROLLUP_REMOVE = f"""
+            UPDATE expense_rollups SET
+                total = total - OLD.amount,
+                count = count - 1,
+                min_amount = CASE WHEN OLD.amount <= min_amount
+                    THEN (SELECT MIN(amount) {_ROLLUP_GROUP}) ELSE min_amount END,
+                max_amount = CASE WHEN OLD.amount >= max_amount
+                    THEN (SELECT MAX(amount) {_ROLLUP_GROUP}) ELSE max_amount END
+            WHERE year_month = substr(OLD.date, 1, 7) AND category = OLD.category
+              AND subcategory = COALESCE(OLD.subcategory, '');
+            DELETE FROM expense_rollups
+            WHERE year_month = substr(OLD.date, 1, 7) AND category = OLD.category
+              AND subcategory = COALESCE(OLD.subcategory, '') AND count <= 0;
+"""
+# Migration 3 rollups (REAL amounts), replaced by the integer-cents rollups of migration 5
+_ROLLUP_SELECT_V3 = """
+    SELECT year_month, category, COALESCE(subcategory, ''),
+           SUM(amount), COUNT(*), MIN(amount), MAX(amount)
+    FROM expenses
+"""
+
+# Amounts are stored as integer minor units (cents). Rows written before
+# migration 5 may still have amount_cents NULL until the background backfill
+# reaches them, so readers derive cents from the legacy REAL column meanwhile.
+MINOR_UNITS = 100
+AMOUNT_CENTS = "COALESCE(amount_cents, CAST(round(amount * 100) AS INTEGER))"
+
+
+def _cents_of(row):
+    return f"COALESCE({row}.amount_cents, CAST(round({row}.amount * 100) AS INTEGER))"
+
+
+_CENTS_ADD = f"""
+            INSERT INTO expense_rollups(year_month, category, subcategory, total_cents, count, min_cents, max_cents)
+            VALUES (substr(NEW.date, 1, 7), NEW.category, COALESCE(NEW.subcategory, ''),
+                    {_cents_of("NEW")}, 1, {_cents_of("NEW")}, {_cents_of("NEW")})
+            ON CONFLICT(year_month, category, subcategory) DO UPDATE SET
+                total_cents = total_cents + excluded.total_cents,
+                count = count + 1,
+                min_cents = min(min_cents, excluded.min_cents),
+                max_cents = max(max_cents, excluded.max_cents);
+"""
+_CENTS_REMOVE = f"""
+            UPDATE expense_rollups SET
+                total_cents = total_cents - {_cents_of("OLD")},
+                count = count - 1,
+                min_cents = CASE WHEN {_cents_of("OLD")} <= min_cents
+                    THEN (SELECT MIN({AMOUNT_CENTS}) {_ROLLUP_GROUP}) ELSE min_cents END,
+                max_cents = CASE WHEN {_cents_of("OLD")} >= max_cents
+                    THEN (SELECT MAX({AMOUNT_CENTS}) {_ROLLUP_GROUP}) ELSE max_cents END
+            WHERE year_month = substr(OLD.date, 1, 7) AND category = OLD.category
+              AND subcategory = COALESCE(OLD.subcategory, '');
+            DELETE FROM expense_rollups
+            WHERE year_month = substr(OLD.date, 1, 7) AND category = OLD.category
+              AND subcategory = COALESCE(OLD.subcategory, '') AND count <= 0;
+"""
+# Rollup rows computed from scratch; callers append an optional WHERE and GROUP BY 1, 2, 3
+_ROLLUP_SELECT = f"""
+    SELECT year_month, category, COALESCE(subcategory, ''),
+           SUM({AMOUNT_CENTS}), COUNT(*), MIN({AMOUNT_CENTS}), MAX({AMOUNT_CENTS})
+    FROM expenses
+"""
+
+
+# Schema migrations, applied in order. PRAGMA user_version holds how many have run.
+MIGRATIONS = [
+    # 1: base table
+    [
+        """
+        CREATE TABLE IF NOT EXISTS expenses(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            date TEXT NOT NULL,
+            amount REAL NOT NULL,
+            category TEXT NOT NULL,
+            subcategory TEXT DEFAULT '',
+            note TEXT DEFAULT ''
+        )
+        """,
+    ],
+    # 2: ISO dates, year_month column and indexes for period filters.
+    # Dates are normalized in place, since every filter, index and cursor
+    # compares date as YYYY-MM-DD; the value as written (e.g. with a time of
+    # day) is kept in original_date for the rows that change.
+    [
+        "ALTER TABLE expenses ADD COLUMN original_date TEXT",
+        """
+        UPDATE expenses SET original_date = date, date = date(date)
+        WHERE date(date) IS NOT NULL AND date <> date(date)
+        """,
+        "ALTER TABLE expenses ADD COLUMN year_month TEXT GENERATED ALWAYS AS (substr(date, 1, 7)) VIRTUAL",
+        "CREATE INDEX IF NOT EXISTS idx_expenses_month_category ON expenses(year_month, category)",
+        "CREATE INDEX IF NOT EXISTS idx_expenses_category_date ON expenses(category, date)",
+        "CREATE INDEX IF NOT EXISTS idx_expenses_date_note ON expenses(date, note)",
+    ],
+    # 3: monthly rollups per (category, subcategory), maintained by triggers
+    [
+        """
+        CREATE TABLE IF NOT EXISTS expense_rollups(
+            year_month TEXT NOT NULL,
+            category TEXT NOT NULL,
+            subcategory TEXT NOT NULL DEFAULT '',
+            total REAL NOT NULL DEFAULT 0,
+            count INTEGER NOT NULL DEFAULT 0,
+            min_amount REAL,
+            max_amount REAL,
+            PRIMARY KEY (year_month, category, subcategory)
+        ) WITHOUT ROWID
+        """,
+        # Bulk writers set suspended = 1 and refresh the touched months once at the end
+        """
+        CREATE TABLE IF NOT EXISTS rollup_control(
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            suspended INTEGER NOT NULL DEFAULT 0
+        )
+        """,
+        "INSERT OR IGNORE INTO rollup_control(id, suspended) VALUES (1, 0)",
+        f"""
+        CREATE TRIGGER IF NOT EXISTS trg_expenses_rollup_insert AFTER INSERT ON expenses
+        WHEN (SELECT suspended FROM rollup_control) = 0
+        BEGIN
+            {_ROLLUP_ADD}
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS trg_expenses_rollup_delete AFTER DELETE ON expenses
+        WHEN (SELECT suspended FROM rollup_control) = 0
+        BEGIN
+            {_ROLLUP_REMOVE}
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS trg_expenses_rollup_update
+        AFTER UPDATE OF date, amount, category, subcategory ON expenses
+        WHEN (SELECT suspended FROM rollup_control) = 0
+        BEGIN
+            {_ROLLUP_REMOVE}
+            {_ROLLUP_ADD}
+        END
+        """,
+        f"INSERT INTO expense_rollups {_ROLLUP_SELECT_V3} GROUP BY 1, 2, 3",
+    ],
+    # 4: (date, id) order for keyset pagination (id is the implicit rowid suffix)
+    [
+        "CREATE INDEX IF NOT EXISTS idx_expenses_date ON expenses(date)",
+    ],
+    # 5: integer cents and an optional currency; rollups rebuilt in cents.
+    # Existing rows keep amount_cents NULL and are converted in batches by
+    # backfill_amount_cents() while the server runs.
+    [
+        "ALTER TABLE expenses ADD COLUMN amount_cents INTEGER",
+        "ALTER TABLE expenses ADD COLUMN currency TEXT",
+        "CREATE INDEX IF NOT EXISTS idx_expenses_cents_pending ON expenses(id) WHERE amount_cents IS NULL",
+        "DROP TRIGGER IF EXISTS trg_expenses_rollup_insert",
+        "DROP TRIGGER IF EXISTS trg_expenses_rollup_delete",
+        "DROP TRIGGER IF EXISTS trg_expenses_rollup_update",
+        "DROP TABLE IF EXISTS expense_rollups",
+        """
+        CREATE TABLE expense_rollups(
+            year_month TEXT NOT NULL,
+            category TEXT NOT NULL,
+            subcategory TEXT NOT NULL DEFAULT '',
+            total_cents INTEGER NOT NULL DEFAULT 0,
+            count INTEGER NOT NULL DEFAULT 0,
+            min_cents INTEGER,
+            max_cents INTEGER,
+            PRIMARY KEY (year_month, category, subcategory)
+        ) WITHOUT ROWID
+        """,
+        f"""
+        CREATE TRIGGER trg_expenses_rollup_insert AFTER INSERT ON expenses
+        WHEN (SELECT suspended FROM rollup_control) = 0
+        BEGIN
+            {_CENTS_ADD}
+        END
+        """,
+        f"""
+        CREATE TRIGGER trg_expenses_rollup_delete AFTER DELETE ON expenses
+        WHEN (SELECT suspended FROM rollup_control) = 0
+        BEGIN
+            {_CENTS_REMOVE}
+        END
+        """,
+        f"""
+        CREATE TRIGGER trg_expenses_rollup_update
+        AFTER UPDATE OF date, amount, amount_cents, category, subcategory ON expenses
+        WHEN (SELECT suspended FROM rollup_control) = 0
+        BEGIN
+            {_CENTS_REMOVE}
+            {_CENTS_ADD}
+        END
+        """,
+        f"INSERT INTO expense_rollups {_ROLLUP_SELECT} GROUP BY 1, 2, 3",
+    ],
+    # 6: full-text index over note, subcategory and category (external content, kept in sync by triggers)
+    [
+        """
+        CREATE VIRTUAL TABLE IF NOT EXISTS expenses_fts USING fts5(
+            note, subcategory, category,
+            content='expenses', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+        )
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_expenses_fts_insert AFTER INSERT ON expenses
+        BEGIN
+            INSERT INTO expenses_fts(rowid, note, subcategory, category)
+            VALUES (NEW.id, NEW.note, NEW.subcategory, NEW.category);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_expenses_fts_delete AFTER DELETE ON expenses
+        BEGIN
+            INSERT INTO expenses_fts(expenses_fts, rowid, note, subcategory, category)
+            VALUES ('delete', OLD.id, OLD.note, OLD.subcategory, OLD.category);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_expenses_fts_update AFTER UPDATE OF note, subcategory, category ON expenses
+        BEGIN
+            INSERT INTO expenses_fts(expenses_fts, rowid, note, subcategory, category)
+            VALUES ('delete', OLD.id, OLD.note, OLD.subcategory, OLD.category);
+            INSERT INTO expenses_fts(rowid, note, subcategory, category)
+            VALUES (NEW.id, NEW.note, NEW.subcategory, NEW.category);
+        END
+        """,
+        "INSERT INTO expenses_fts(expenses_fts) VALUES ('rebuild')",
+    ],
+    # 7: recurring expense templates and monthly budgets per category.
+    # next_date is the first occurrence not yet written to expenses, and the
+    # unique (recurring_id, date) index makes writing an occurrence twice a no-op.
+    [
+        """
+        CREATE TABLE IF NOT EXISTS recurring_expenses(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            amount_cents INTEGER NOT NULL,
+            currency TEXT,
+            category TEXT NOT NULL,
+            subcategory TEXT NOT NULL DEFAULT '',
+            note TEXT NOT NULL DEFAULT '',
+            frequency TEXT NOT NULL CHECK (frequency IN ('daily', 'weekly', 'monthly', 'yearly')),
+            interval INTEGER NOT NULL DEFAULT 1 CHECK (interval >= 1),
+            start_date TEXT NOT NULL,
+            end_date TEXT,
+            occurrences INTEGER NOT NULL DEFAULT 0,
+            next_date TEXT,
+            active INTEGER NOT NULL DEFAULT 1
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_recurring_due ON recurring_expenses(next_date) WHERE active = 1",
+        "ALTER TABLE expenses ADD COLUMN recurring_id INTEGER",
+        """
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_expenses_recurring
+        ON expenses(recurring_id, date) WHERE recurring_id IS NOT NULL
+        """,
+        # Spending against a budget is read from expense_rollups, which the triggers keep current
+        """
+        CREATE TABLE IF NOT EXISTS budgets(
+            category TEXT PRIMARY KEY,
+            monthly_cents INTEGER NOT NULL CHECK (monthly_cents > 0),
+            alert_percent INTEGER NOT NULL DEFAULT 80 CHECK (alert_percent BETWEEN 1 AND 100)
+        ) WITHOUT ROWID
+        """,
+    ],
+    # 8: a counter of deletes and edits to exported columns, so a snapshot
+    # export can tell whether rows it already wrote changed without rescanning them
+    [
+        """
+        CREATE TABLE IF NOT EXISTS expense_changes(
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            changes INTEGER NOT NULL
+        )
+        """,
+        "INSERT OR IGNORE INTO expense_changes(id, changes) VALUES (1, 0)",
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_expenses_changes_delete AFTER DELETE ON expenses
+        BEGIN
+            UPDATE expense_changes SET changes = changes + 1 WHERE id = 1;
+        END
+        """,
+        # The cents backfill fills amount_cents with the value already in use, which is not a change
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_expenses_changes_update
+        AFTER UPDATE OF date, amount, amount_cents, category, subcategory ON expenses
+        WHEN OLD.date IS NOT NEW.date OR OLD.category IS NOT NEW.category
+          OR OLD.subcategory IS NOT NEW.subcategory
+          OR COALESCE(OLD.amount_cents, CAST(round(OLD.amount * 100) AS INTEGER))
+             IS NOT COALESCE(NEW.amount_cents, CAST(round(NEW.amount * 100) AS INTEGER))
+        BEGIN
+            UPDATE expense_changes SET changes = changes + 1 WHERE id = 1;
+        END
+        """,
+    ],
+]
+
+
+def _schema_version(conn):
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version > len(MIGRATIONS):
+        raise RuntimeError(f"Database schema version {version} is newer than this server supports ({len(MIGRATIONS)})")
+    return version
+
+
+def migrate(conn):
+    '''Apply pending migrations, each in its own transaction.
+
+    user_version is read again once each transaction holds the write lock, so
+    when several processes open an old database together, the ones that had
+    to wait skip the migrations another process applied meanwhile.
+    '''
+    version = _schema_version(conn)
+    while version < len(MIGRATIONS):
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            version = _schema_version(conn)
+            if version < len(MIGRATIONS):
+                version += 1
+                logger.info("Applying schema migration %s", version)
+                for statement in MIGRATIONS[version - 1]:
+                    conn.execute(statement)
+                conn.execute(f"PRAGMA user_version = {version}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return len(MIGRATIONS)
+
+
+# Database files already migrated and checked by this process
+_ready = set()
+_ready_lock = threading.Lock()
+
+
+def init_db(db_path):
+    '''Create or migrate the database at db_path and check its schema, once per process.
+
+    Called lazily when the first pooled connection to a file is opened, so
+    importing the server does no I/O. Later calls are a set lookup.
+    '''
+    key = str(db_path)
+    if key in _ready:
+        return
+    with _ready_lock:
+        if key in _ready:
+            return
+        # A private connection, so the pool never holds one opened before migrating;
+        # a long timeout, since another process may be migrating a large file
+        conn = sqlite3.connect(db_path, timeout=MIGRATION_TIMEOUT)
+        try:
+            migrate(conn)
+            if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'expenses'").fetchone() is None:
+                raise RuntimeError(f"Table 'expenses' not found in {db_path}")
+        finally:
+            conn.close()
+        _ready.add(key)
+        logger.info("Database %s is ready", db_path)
+
+
+def normalize_date(value):
+    '''Return value as an ISO YYYY-MM-DD string, raising ValueError if it is not a date.'''
+    value = str(value).strip().lower()
+    try:
+        return datetime.date.fromisoformat(value[:10]).isoformat()
+    except ValueError:
+        raise ValueError(f"Invalid date '{value}', expected YYYY-MM-DD") from None
+
+
+# amount (REAL) is kept in step with amount_cents for older readers of the file
+INSERT_EXPENSE = """
+    INSERT INTO expenses(date, amount, amount_cents, currency, category, subcategory, note)
+    VALUES (?,?,?,?,?,?,?)
+"""
+
+
+def to_cents(amount):
+    '''Convert an amount (number or numeric string) to integer cents, rounding half up.'''
+    try:
+        value = decimal.Decimal(str(amount).strip())
+    except decimal.InvalidOperation:
+        raise ValueError(f"Invalid amount '{amount}'") from None
+    if not value.is_finite():
+        raise ValueError(f"Invalid amount '{amount}'")
+    return int(value.scaleb(2).to_integral_value(decimal.ROUND_HALF_UP))
+
+
+def to_amount(cents):
+    '''Convert integer cents back to a decimal amount for responses.'''
+    return None if cents is None else cents / MINOR_UNITS
+
+
+def average_amount(total_cents, count):
+    '''Mean amount of count expenses totalling total_cents, rounded to the cent.'''
+    return round(total_cents / count / MINOR_UNITS, 2) if count else 0
+
+
+def money(row, *columns):
+    '''dict(row) with the given cents columns converted to amounts.'''
+    result = dict(row)
+    for column in columns:
+        result[column] = to_amount(result[column])
+    return result
+
+
+def normalize_currency(currency):
+    '''Upper-case ISO 4217 style code, or None when not given.'''
+    currency = str(currency or "").strip().upper()
+    if not currency:
+        return None
+    if len(currency) != 3 or not currency.isalpha():
+        raise ValueError(f"Invalid currency '{currency}', expected a 3-letter code like USD")
+    return currency
+
+
+def normalize_expense(date, amount, category, subcategory="", note="", currency=None):
+    '''Validate one expense and return the row to insert, in INSERT_EXPENSE column order.'''
+    cents = to_cents(amount)
+    category = str(category or "").strip().lower()
+    if not category:
+        raise ValueError("Category is required")
+    return (
+        normalize_date(date),
+        cents / MINOR_UNITS,
+        cents,
+        normalize_currency(currency),
+        category,
+        str(subcategory or "").lower(),
+        str(note or "").lower(),
+    )
+
+
+def period_months(period, today=None):
+    '''Resolve a period into an inclusive (first, last) YYYY-MM range, or None for "all".
+
+    Accepts "all", "monthly"/"current" (this month), "yearly" (this year),
+    "YYYY-MM" or "YYYY".
+    '''
+    today = today or datetime.date.today()
+    period = (period or "all").strip().lower()
+    if period == "all":
+        return None
+    if period in ("monthly", "current"):
+        month = f"{today.year:04d}-{today.month:02d}"
+        return month, month
+    if period == "yearly":
+        return f"{today.year:04d}-01", f"{today.year:04d}-12"
+    if len(period) == 4 and period.isdigit():
+        return f"{period}-01", f"{period}-12"
+    try:
+        month = datetime.date.fromisoformat(f"{period}-01")
+    except ValueError:
+        raise ValueError(f"Invalid period '{period}', expected all, monthly, yearly, YYYY-MM or YYYY") from None
+    return month.isoformat()[:7], month.isoformat()[:7]
+
+
+def months_filter(months):
+    '''SQL predicate and params restricting expenses to a (first, last) range from period_months().
+
+    Compares year_month, which idx_expenses_month_category serves.
+    '''
+    if months is None:
+        return "", []
+    return "year_month BETWEEN ? AND ?", list(months)
+
+
+def rebuild_rollups(conn, months=None):
+    '''Recompute expense_rollups from expenses, for every month or just the given YYYY-MM months.
+
+    Runs inside the caller's transaction when one is open.
+    '''
+    if months is None:
+        conn.execute("DELETE FROM expense_rollups")
+        conn.execute(f"INSERT INTO expense_rollups {_ROLLUP_SELECT} GROUP BY 1, 2, 3")
+        return
+    months = sorted(set(months))
+    for start in range(0, len(months), 500):
+        chunk = months[start:start + 500]
+        marks = ",".join("?" * len(chunk))
+        conn.execute(f"DELETE FROM expense_rollups WHERE year_month IN ({marks})", chunk)
+        conn.execute(
+            f"INSERT INTO expense_rollups {_ROLLUP_SELECT} WHERE year_month IN ({marks}) GROUP BY 1, 2, 3",
+            chunk,
+        )
+
+
+def backfill_amount_cents(conn, batch_size=5000):
+    '''Convert up to batch_size legacy rows to amount_cents; returns how many were converted.
+
+    Runs inside the caller's transaction. Values are unchanged (readers
+    already derive the same cents), so rollup triggers are skipped.
+    '''
+    conn.execute("UPDATE rollup_control SET suspended = 1")
+    cur = conn.execute(
+        """
+        UPDATE expenses SET amount_cents = CAST(round(amount * 100) AS INTEGER)
+        WHERE id IN (SELECT id FROM expenses WHERE amount_cents IS NULL LIMIT ?)
+        """,
+        (batch_size,),
+    )
+    conn.execute("UPDATE rollup_control SET suspended = 0")
+    return cur.rowcount
+
+
+def verify_rollups(conn):
+    '''Return the rollup groups that no longer match the raw expenses (amounts in cents).'''
+    cur = conn.execute(f"""
+        WITH actual(year_month, category, subcategory, total_cents, count, min_cents, max_cents) AS (
+            {_ROLLUP_SELECT} GROUP BY 1, 2, 3
+        )
+        SELECT a.year_month, a.category, a.subcategory,
+               a.total_cents AS expected_total_cents, r.total_cents AS rollup_total_cents,
+               a.count AS expected_count, r.count AS rollup_count
+        FROM actual a
+        LEFT JOIN expense_rollups r
+          ON r.year_month = a.year_month AND r.category = a.category AND r.subcategory = a.subcategory
+        WHERE r.year_month IS NULL OR r.count <> a.count OR r.total_cents <> a.total_cents
+           OR r.min_cents <> a.min_cents OR r.max_cents <> a.max_cents
+        UNION ALL
+        SELECT r.year_month, r.category, r.subcategory, NULL, r.total_cents, NULL, r.count
+        FROM expense_rollups r
+        WHERE NOT EXISTS (
+            SELECT 1 FROM actual a
+            WHERE a.year_month = r.year_month AND a.category = r.category AND a.subcategory = r.subcategory
+        )
+    """)
+    return [dict(row) for row in cur.fetchall()]
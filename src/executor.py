@@ -0,0 +1,272 @@
+import asyncio
+import atexit
+import logging
+import queue
+import sqlite3
+import threading
+import time
+import weakref
+from collections import namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from .cache import result_cache
+from .db import get_connection
+
+logger = logging.getLogger(__name__)
+
+# Threads running read-only queries, and how many reads may wait for one
+READ_WORKERS = 4
+MAX_PENDING_READS = 64
+
+# Queued writes beyond this are rejected instead of piling up
+MAX_PENDING_WRITES = 256
+
+# Most writes committed together in one transaction
+GROUP_COMMIT_MAX = 64
+
+# Seconds a call may wait for a slot and run before it fails
+READ_TIMEOUT = 30.0
+WRITE_TIMEOUT = 10.0
+
+# Timeout for maintenance and bulk jobs (imports, rollup rebuilds)
+BULK_TIMEOUT = 600.0
+
+# Seconds between checks of the cache's watched databases for other processes' commits
+WATCH_INTERVAL = 1.0
+
+
+# Queue sentinel that stops the writer thread
+_STOP = object()
+
+WriteJob = namedtuple("WriteJob", "db_path fn args own_transaction future")
+
+
+class DatabaseBusy(RuntimeError):
+    '''Raised when a call cannot be admitted or finished within its timeout.'''
+
+
+class DatabaseExecutor:
+    '''Runs blocking sqlite3 work off the event loop.
+
+    Reads run on a bounded thread pool, each thread holding a read-only
+    connection. Writes are queued to a single writer thread, which drains
+    whatever is waiting and commits it as one transaction (each job in its own
+    savepoint, so one failing job does not undo the others).
+
+    The writer thread also tells the result cache about commits by other
+    processes: PRAGMA data_version on its own connection changes only when
+    another connection commits, so it is checked before each group and,
+    every WATCH_INTERVAL, for every database the cache watches.
+    '''
+
+    def __init__(self, read_workers=READ_WORKERS, max_pending_reads=MAX_PENDING_READS,
+                 max_pending_writes=MAX_PENDING_WRITES, group_commit_max=GROUP_COMMIT_MAX):
+        self.read_workers = read_workers
+        self.max_pending_reads = max_pending_reads
+        self.group_commit_max = group_commit_max
+        self._readers = ThreadPoolExecutor(max_workers=read_workers, thread_name_prefix="db-read")
+        self._read_slots = weakref.WeakKeyDictionary()  # event loop -> asyncio.Semaphore
+        self._writes = queue.Queue(maxsize=max_pending_writes)
+        self._writer = None
+        self._writer_lock = threading.Lock()
+        self._data_versions = {}  # db_path -> (writer connection, data_version it last saw)
+
+    # Reads
+
+    async def read(self, db_path, fn, *args, timeout=READ_TIMEOUT):
+        '''Run fn(conn, *args) on a read-only connection and return its result.'''
+        self._ensure_writer()  # it watches what reads cache for writes from other processes
+        loop = asyncio.get_running_loop()
+        slots = self._read_slots.get(loop)
+        if slots is None:
+            slots = self._read_slots[loop] = asyncio.Semaphore(self.read_workers + self.max_pending_reads)
+
+        deadline = loop.time() + timeout
+        try:
+            await asyncio.wait_for(slots.acquire(), timeout)
+        except TimeoutError:
+            raise DatabaseBusy("Too many concurrent reads, try again later") from None
+        running = {}
+        try:
+            future = loop.run_in_executor(self._readers, self._run_read, running, db_path, fn, args)
+            return await asyncio.wait_for(future, max(deadline - loop.time(), 0))
+        except TimeoutError:
+            # Abort the statement if it already started; a queued read is cancelled by wait_for
+            conn = running.get("conn")
+            if conn is not None:
+                conn.interrupt()
+            raise DatabaseBusy(f"Read timed out after {timeout}s") from None
+        finally:
+            slots.release()
+
+    async def read_many(self, db_paths, fn, *args, timeout=READ_TIMEOUT):
+        '''Run fn(conn, *args) against every database in db_paths in parallel.
+
+        At most read_workers run at once, so a fan-out over many databases
+        never fills the admission queue other calls wait in. Returns the
+        results in db_paths order; a failed read yields its exception.
+        '''
+        limit = asyncio.Semaphore(self.read_workers)
+
+        async def one(db_path):
+            async with limit:
+                return await self.read(db_path, fn, *args, timeout=timeout)
+
+        return await asyncio.gather(*(one(path) for path in db_paths), return_exceptions=True)
+
+    @staticmethod
+    def _run_read(running, db_path, fn, args):
+        conn = running["conn"] = get_connection(db_path, readonly=True)
+        try:
+            return fn(conn, *args)
+        finally:
+            running.pop("conn", None)
+            if conn.in_transaction:
+                conn.rollback()
+
+    # Writes
+
+    async def write(self, db_path, fn, *args, timeout=WRITE_TIMEOUT, own_transaction=False):
+        '''Run fn(conn, *args) on the writer connection and return its result once committed.
+
+        fn must not commit. Jobs with own_transaction=True run alone and manage
+        their own BEGIN/COMMIT (used by bulk imports).
+        '''
+        self._ensure_writer()
+        job = WriteJob(str(db_path), fn, args, own_transaction, Future())
+        try:
+            self._writes.put_nowait(job)
+        except queue.Full:
+            raise DatabaseBusy("Too many pending writes, try again later") from None
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(job.future), timeout)
+        except TimeoutError:
+            if job.future.cancel():
+                raise DatabaseBusy(f"Write not started within {timeout}s, nothing was written") from None
+            # The caller never learns which months this wrote, so drop db_path's cached results once it commits
+            job.future.add_done_callback(lambda future: self._invalidate_committed(future, db_path))
+            raise DatabaseBusy(f"Write still running after {timeout}s; it may yet be committed") from None
+
+    @staticmethod
+    def _invalidate_committed(future, db_path):
+        if not future.cancelled() and future.exception() is None:
+            result_cache.invalidate(scope=db_path)
+
+    def _ensure_writer(self):
+        with self._writer_lock:
+            if self._writer is None or not self._writer.is_alive():
+                self._writer = threading.Thread(target=self._write_loop, name="db-writer", daemon=True)
+                self._writer.start()
+
+    def _write_loop(self):
+        carry = None
+        next_watch = time.monotonic()
+        while True:
+            if time.monotonic() >= next_watch:
+                self._watch()
+                next_watch = time.monotonic() + WATCH_INTERVAL
+            if carry is not None:
+                job, carry = carry, None
+            else:
+                try:
+                    job = self._writes.get(timeout=max(next_watch - time.monotonic(), 0))
+                except queue.Empty:
+                    continue
+            if job is _STOP:
+                return
+            if job.own_transaction:
+                self._run_exclusive(job)
+                continue
+
+            batch = [job]
+            while len(batch) < self.group_commit_max:
+                try:
+                    job = self._writes.get_nowait()
+                except queue.Empty:
+                    break
+                if job is _STOP or job.own_transaction:
+                    # Handled on the next turn, after this group commits
+                    carry = job
+                    break
+                batch.append(job)
+
+            by_path = {}
+            for job in batch:
+                by_path.setdefault(job.db_path, []).append(job)
+            for db_path, jobs in by_path.items():
+                self._run_group(db_path, jobs)
+
+    @staticmethod
+    def _run_exclusive(job):
+        if not job.future.set_running_or_notify_cancel():
+            return
+        try:
+            job.future.set_result(job.fn(get_connection(job.db_path), *job.args))
+        except BaseException as e:
+            job.future.set_exception(e)
+
+    def _watch(self):
+        for db_path in result_cache.watched():
+            try:
+                self._check_data_version(get_connection(db_path), db_path)
+            except Exception as e:
+                logger.debug("Cannot check %s for writes from other processes: %s", db_path, e)
+
+    def _check_data_version(self, conn, db_path):
+        '''Invalidate db_path's cached results if another connection committed since the last check.
+
+        A connection seen for the first time (or reopened) counts as changed,
+        since nothing watched db_path before it.
+        '''
+        version = conn.execute("PRAGMA data_version").fetchone()[0]
+        seen, self._data_versions[db_path] = self._data_versions.get(db_path), (conn, version)
+        if seen is None or seen[0] is not conn or seen[1] != version:
+            result_cache.invalidate(scope=db_path)
+
+    def _run_group(self, db_path, jobs):
+        conn = None
+        done = []
+        try:
+            conn = get_connection(db_path)
+            conn.execute("BEGIN IMMEDIATE")
+            self._check_data_version(conn, db_path)
+            for job in jobs:
+                if not job.future.set_running_or_notify_cancel():
+                    continue
+                conn.execute("SAVEPOINT job")
+                try:
+                    result = job.fn(conn, *job.args)
+                except Exception as e:
+                    conn.execute("ROLLBACK TO job")
+                    conn.execute("RELEASE job")
+                    job.future.set_exception(e)
+                    continue
+                conn.execute("RELEASE job")
+                done.append((job.future, result))
+            conn.commit()
+        except BaseException as e:
+            # Also covers failing to open db_path or to BEGIN: no job may be left pending
+            logger.error("Group commit of %s writes to %s failed: %s", len(jobs), db_path, e)
+            try:
+                if conn is not None and conn.in_transaction:
+                    conn.rollback()
+            except sqlite3.Error as rollback_error:
+                logger.error("Rollback of %s failed: %s", db_path, rollback_error)
+            for job in jobs:
+                if job.future.running() or (not job.future.done() and job.future.set_running_or_notify_cancel()):
+                    job.future.set_exception(e)
+            return
+        if len(done) > 1:
+            logger.debug("Group-committed %s writes", len(done))
+        for future, result in done:
+            future.set_result(result)
+
+    def shutdown(self):
+        if self._writer is not None and self._writer.is_alive():
+            self._writes.put(_STOP)
+            self._writer.join(timeout=5)
+        self._readers.shutdown(wait=False, cancel_futures=True)
+
+
+db_executor = DatabaseExecutor()
+atexit.register(db_executor.shutdown)
@@ -0,0 +1,115 @@
+import csv
+import json
+import logging
+from pathlib import Path
+
+from .db import INSERT_EXPENSE, normalize_expense, rebuild_rollups
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 1000
+
+# Per-row errors kept in the report; the rest are only counted
+MAX_REPORTED_ERRORS = 100
+
+FORMATS = ("csv", "jsonl")
+
+
+def detect_format(path, fmt=None):
+    '''Return "csv" or "jsonl" from an explicit format or the file extension.'''
+    if fmt:
+        fmt = fmt.lower()
+    else:
+        fmt = {".csv": "csv", ".jsonl": "jsonl", ".ndjson": "jsonl"}.get(Path(path).suffix.lower())
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported import format '{fmt}', expected one of {list(FORMATS)}")
+    return fmt
+
+
+def iter_records(path, fmt):
+    '''Stream (line number, record) pairs. A record is a dict, or the exception raised parsing it.'''
+    with open(path, newline="", encoding="utf-8") as f:
+        if fmt == "csv":
+            reader = csv.DictReader(f)
+            for record in reader:
+                yield reader.line_num, record
+            return
+        for line_no, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                if not isinstance(record, dict):
+                    raise ValueError("Expected a JSON object")
+            except ValueError as e:
+                record = e
+            yield line_no, record
+
+
+def normalize_record(record):
+    if isinstance(record, Exception):
+        raise record
+    missing = [key for key in ("date", "amount", "category") if record.get(key) in (None, "")]
+    if missing:
+        raise ValueError(f"Missing required field(s): {', '.join(missing)}")
+    return normalize_expense(
+        record["date"],
+        record["amount"],
+        record["category"],
+        record.get("subcategory") or "",
+        record.get("note") or "",
+        record.get("currency"),
+    )
+
+
+def import_expenses(conn, path, fmt=None, batch_size=DEFAULT_BATCH_SIZE):
+    '''Import expenses from a CSV or JSONL file in a single transaction.
+
+    Rows are validated like add_expense and written with executemany in
+    batches of batch_size. Invalid rows are reported and skipped. Rollup
+    triggers are suspended for the import and the touched months are
+    recomputed once before commit.
+    '''
+    fmt = detect_format(path, fmt)
+    batch_size = max(1, int(batch_size))
+    imported = 0
+    failed = 0
+    errors = []
+    months = set()
+    batch = []
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute("UPDATE rollup_control SET suspended = 1")
+        for line_no, record in iter_records(path, fmt):
+            try:
+                row = normalize_record(record)
+            except (TypeError, ValueError) as e:
+                failed += 1
+                if len(errors) < MAX_REPORTED_ERRORS:
+                    errors.append({"line": line_no, "error": str(e)})
+                continue
+            batch.append(row)
+            months.add(row[0][:7])
+            if len(batch) >= batch_size:
+                conn.executemany(INSERT_EXPENSE, batch)
+                imported += len(batch)
+                batch.clear()
+        if batch:
+            conn.executemany(INSERT_EXPENSE, batch)
+            imported += len(batch)
+
+        rebuild_rollups(conn, months)
+        conn.execute("UPDATE rollup_control SET suspended = 0")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    logger.info("Imported %s expenses from %s (%s rejected)", imported, path, failed)
+    return {
+        "imported": imported,
+        "failed": failed,
+        "months": sorted(months),
+        "errors": errors,
+    }
@@ -0,0 +1,64 @@
+import logging
+import re
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# Name of the ledger tools use when none is given
+DEFAULT_LEDGER = "default"
+
+# Ledger names become file names, so only a safe subset is accepted
+_NAME = re.compile(r"[a-z0-9][a-z0-9_-]{0,63}")
+
+# File suffix of per-ledger databases
+SUFFIX = ".db"
+
+
+class Ledgers:
+    '''Maps ledger (tenant) names onto SQLite files, one database per ledger.
+
+    The default ledger is default_path, so a single-user server keeps its
+    existing file. Every other ledger lives in directory as <name>.db and is
+    created, with the current schema, the first time a tool uses it.
+    '''
+
+    def __init__(self, default_path, directory):
+        self.default_path = Path(default_path)
+        self.directory = Path(directory)
+        self._directory_ready = False
+
+    @staticmethod
+    def normalize(ledger):
+        '''Validated, lower-cased ledger name; None or "" mean the default ledger.'''
+        name = (ledger or DEFAULT_LEDGER).strip().lower()
+        if not _NAME.fullmatch(name):
+            raise ValueError(
+                f"Invalid ledger name {ledger!r}: use 1-64 letters, digits, '-' or '_', starting with a letter or digit"
+            )
+        return name
+
+    def path(self, ledger=None):
+        '''Database file of ledger. Its directory is created; the file itself on first open.'''
+        name = self.normalize(ledger)
+        if name == DEFAULT_LEDGER:
+            return self.default_path
+        if not self._directory_ready:
+            if not self.directory.is_dir():
+                self.directory.mkdir(parents=True, exist_ok=True)
+                logger.info("Created ledger directory %s", self.directory)
+            self._directory_ready = True
+        return self.directory / f"{name}{SUFFIX}"
+
+    def exists(self, ledger):
+        name = self.normalize(ledger)
+        return (self.default_path if name == DEFAULT_LEDGER else self.directory / f"{name}{SUFFIX}").exists()
+
+    def names(self):
+        '''Every ledger that has a database file, the default ledger first.'''
+        names = [DEFAULT_LEDGER] if self.default_path.exists() else []
+        if self.directory.is_dir():
+            names += sorted(
+                p.stem for p in self.directory.glob(f"*{SUFFIX}")
+                if _NAME.fullmatch(p.stem) and p.stem != DEFAULT_LEDGER
+            )
+        return names
@@ -0,0 +1,62 @@
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+
+# Environment variables controlling logging
+LOG_LEVEL_ENV = "EXPENSE_TRACKER_LOG_LEVEL"   # DEBUG, INFO, WARNING, ERROR (default)
+LOG_FILE_ENV = "EXPENSE_TRACKER_LOG_FILE"     # defaults to expense_tracker_debug.log / expense_tracker_error.log
+TRACE_ENV = "EXPENSE_TRACKER_TRACE"           # 1 = log every SQL statement and per-call DB file checks
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+_listener = None
+
+
+def tracing_enabled():
+    '''True when SQL tracing and per-call diagnostics are switched on.'''
+    return os.environ.get(TRACE_ENV, "").lower() in ("1", "true", "yes", "on")
+
+
+def setup_logging():
+    """Setup logging that doesn't interfere with MCP protocol.
+
+    Records are handed to a QueueHandler and written by a QueueListener thread,
+    so tool calls never block on file or stderr I/O.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    level_name = os.environ.get(LOG_LEVEL_ENV, "DEBUG" if tracing_enabled() else "ERROR").upper()
+    level = logging.getLevelName(level_name)
+    if not isinstance(level, int):
+        level = logging.ERROR
+    debug = level <= logging.DEBUG
+
+    default_file = 'expense_tracker_debug.log' if debug else 'expense_tracker_error.log'
+    formatter = logging.Formatter(LOG_FORMAT)
+    handlers = [logging.FileHandler(os.environ.get(LOG_FILE_ENV, default_file), delay=True)]
+    if debug:
+        handlers.append(logging.StreamHandler(sys.stderr))  # Use stderr instead of stdout
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging():
+    '''Flush queued records and stop the listener thread.'''
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,126 @@
+import asyncio
+import datetime
+import logging
+
+from .cache import result_cache
+from .db import backfill_amount_cents, normalize_date
+from .executor import BULK_TIMEOUT, db_executor
+from .recurring import MATERIALIZE_BATCH_SIZE, has_due, materialize_due
+
+logger = logging.getLogger(__name__)
+
+# Rows converted per write job, and the pause between jobs so tool writes get through
+BACKFILL_BATCH_SIZE = 5000
+BACKFILL_PAUSE = 0.05
+
+# Seconds between scheduler passes over every ledger, and the pause between its write batches
+SCHEDULE_INTERVAL = 3600
+MATERIALIZE_PAUSE = 0.05
+
+_running = set()
+
+
+def _has_pending(conn):
+    # Served by the partial index idx_expenses_cents_pending
+    return conn.execute("SELECT EXISTS(SELECT 1 FROM expenses WHERE amount_cents IS NULL)").fetchone()[0]
+
+
+async def backfill_amounts(db_path, batch_size=BACKFILL_BATCH_SIZE, pause=BACKFILL_PAUSE):
+    '''Convert rows written before integer cents (migration 5) in small batches.
+
+    Each batch is an ordinary queued write, so the server keeps answering
+    while a large ledger is converted. Safe to cancel and to restart.
+    '''
+    key = str(db_path)
+    if key in _running or not await db_executor.read(db_path, _has_pending):
+        return 0
+    _running.add(key)
+    converted = 0
+    try:
+        while True:
+            done = await db_executor.write(db_path, backfill_amount_cents, batch_size, timeout=BULK_TIMEOUT)
+            converted += done
+            if done < batch_size:
+                break
+            await asyncio.sleep(pause)
+        logger.info("Converted %s expenses to integer cents in %s", converted, db_path)
+    except asyncio.CancelledError:
+        logger.info("Cents backfill of %s paused after %s rows", db_path, converted)
+        raise
+    except Exception as e:
+        logger.error("Cents backfill of %s failed after %s rows: %s", db_path, converted, e)
+    finally:
+        _running.discard(key)
+    return converted
+
+
+async def materialize_recurring(db_path, until=None, batch_size=MATERIALIZE_BATCH_SIZE, pause=MATERIALIZE_PAUSE):
+    '''Write every recurring expense due on or before until (default today) as expenses.
+
+    Occurrences are written in batches of queued writes, like the cents backfill.
+    Safe to run concurrently and repeatedly: materialize_due() is idempotent.
+    '''
+    until = normalize_date(until or datetime.date.today())
+    created = 0
+    months = set()
+    if await db_executor.read(db_path, has_due, until):
+        while True:
+            batch = await db_executor.write(db_path, materialize_due, until, batch_size, timeout=BULK_TIMEOUT)
+            created += batch["created"]
+            if batch["months"]:
+                months.update(batch["months"])
+                result_cache.invalidate(batch["months"], db_path)
+            if not batch["more"]:
+                break
+            await asyncio.sleep(pause)
+    return {"created": created, "months": sorted(months), "until": until}
+
+
+async def backfill_ledgers(db_paths):
+    '''backfill_amounts() of every database db_paths() lists, one after another.'''
+    for db_path in db_paths():
+        try:
+            await backfill_amounts(db_path)
+        except Exception as e:
+            logger.error("Cents backfill of %s failed: %s", db_path, e)
+
+
+async def run_scheduler(db_paths, interval=SCHEDULE_INTERVAL):
+    '''Materialize due recurring expenses in every database db_paths() lists, now and every interval seconds.'''
+    while True:
+        for db_path in db_paths():
+            try:
+                await materialize_recurring(db_path)
+            except Exception as e:
+                logger.error("Recurring expenses of %s failed: %s", db_path, e)
+        await asyncio.sleep(interval)
+
+
+class BackgroundJobs:
+    '''Maintenance tasks shared by every server session.
+
+    FastMCP enters the lifespan once per session; like the connection pool,
+    the jobs are started by the first session and cancelled only when the
+    last one is released, so closing one client never stops them for the rest.
+    '''
+
+    def __init__(self, *jobs):
+        # Functions returning the coroutine of each job
+        self._jobs = jobs
+        self._tasks = []
+        self._sessions = 0
+
+    def open_session(self):
+        self._sessions += 1
+        if self._sessions == 1:
+            self._tasks = [asyncio.create_task(job()) for job in self._jobs]
+
+    def release_session(self):
+        self._sessions = max(self._sessions - 1, 0)
+        if not self._sessions:
+            tasks, self._tasks = self._tasks, []
+            for task in tasks:
+                task.cancel()
+
+    def running(self):
+        return sum(not task.done() for task in self._tasks)
@@ -0,0 +1,390 @@
+import atexit
+import bisect
+import functools
+import inspect
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# Environment variables controlling metrics
+SQL_METRICS_ENV = "EXPENSE_TRACKER_SQL_METRICS"      # 0 = skip per-statement timing
+SLOW_QUERY_ENV = "EXPENSE_TRACKER_SLOW_QUERY_MS"     # statements slower than this are captured
+METRICS_FILE_ENV = "EXPENSE_TRACKER_METRICS_FILE"    # Prometheus text file refreshed on demand and at exit
+
+# Latency histogram bucket upper bounds, in seconds
+LATENCY_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025,
+                   0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float("inf"))
+
+SLOW_QUERY_MS = float(os.environ.get(SLOW_QUERY_ENV, "100"))
+
+# Slow queries kept, newest last
+SLOW_QUERY_LOG = 50
+
+# Distinct SQL statements tracked; the rest are counted under OTHER_STATEMENT
+MAX_STATEMENTS = 500
+OTHER_STATEMENT = "<other>"
+
+# Statements worth running EXPLAIN QUERY PLAN on
+_EXPLAINABLE = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE", "REPLACE")
+
+# Collapse "?, ?, ?" placeholder lists so IN (...) of any length shares one key
+_PLACEHOLDER_LIST = re.compile(r"\?(?:\s*,\s*\?)+")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def sql_metrics_enabled():
+    return os.environ.get(SQL_METRICS_ENV, "1").lower() not in ("0", "false", "no", "off")
+
+
+class Histogram:
+    '''Fixed-bucket latency histogram (same layout as a Prometheus histogram).'''
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q):
+        '''Estimate the q-quantile by interpolating inside its bucket.'''
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        cumulative = 0
+        lower = 0.0
+        for upper, count in zip(self.buckets, self.counts):
+            if count and cumulative + count >= rank:
+                if upper == float("inf"):
+                    return self.max
+                return min(lower + (upper - lower) * (rank - cumulative) / count, self.max)
+            cumulative += count
+            lower = upper
+        return self.max
+
+    def summary(self):
+        return {
+            "mean_ms": round(self.sum / self.count * 1000, 3) if self.count else 0.0,
+            "p50_ms": round(self.quantile(0.50) * 1000, 3),
+            "p95_ms": round(self.quantile(0.95) * 1000, 3),
+            "p99_ms": round(self.quantile(0.99) * 1000, 3),
+            "max_ms": round(self.max * 1000, 3),
+        }
+
+
+class Metrics:
+    '''Process-wide tool and SQL statement metrics.
+
+    Tool calls are timed by the wrapper from instrument(); SQL statements are
+    timed by InstrumentedCursor from execute() until their rows are consumed.
+    Statements slower than slow_query_ms are kept with their query plan.
+    '''
+
+    def __init__(self, slow_query_ms=SLOW_QUERY_MS):
+        self.slow_query_ms = slow_query_ms
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._started = time.time()
+            self._tools = {}       # tool name -> [calls, errors, Histogram]
+            self._statements = {}  # normalized sql -> [calls, rows, Histogram]
+            self._keys = {}        # raw sql -> normalized sql
+            self._slow = deque(maxlen=SLOW_QUERY_LOG)
+
+    # Recording
+
+    def record_tool(self, name, seconds, error):
+        with self._lock:
+            stats = self._tools.get(name)
+            if stats is None:
+                stats = self._tools[name] = [0, 0, Histogram()]
+            stats[0] += 1
+            stats[1] += error
+            stats[2].observe(seconds)
+
+    def record_sql(self, conn, sql, params, seconds, rows):
+        with self._lock:
+            key = self._keys.get(sql)
+            if key is None:
+                key = _WHITESPACE.sub(" ", _PLACEHOLDER_LIST.sub("?, ...", sql)).strip()
+                if len(self._keys) < MAX_STATEMENTS * 4:
+                    self._keys[sql] = key
+            stats = self._statements.get(key)
+            if stats is None:
+                if len(self._statements) >= MAX_STATEMENTS:
+                    key = OTHER_STATEMENT
+                stats = self._statements.setdefault(key, [0, 0, Histogram()])
+            stats[0] += 1
+            stats[1] += rows
+            stats[2].observe(seconds)
+
+        if seconds * 1000 >= self.slow_query_ms:
+            entry = {
+                "sql": key,
+                "duration_ms": round(seconds * 1000, 3),
+                "rows": rows,
+                "at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "plan": explain(conn, sql, params),
+            }
+            logger.warning("Slow query (%.1f ms, %s rows): %s", entry["duration_ms"], rows, key)
+            with self._lock:
+                self._slow.append(entry)
+
+    # Reporting
+
+    def snapshot(self, top=20):
+        with self._lock:
+            tools = {
+                name: {"calls": calls, "errors": errors, **hist.summary()}
+                for name, (calls, errors, hist) in sorted(self._tools.items())
+            }
+            statements = sorted(self._statements.items(), key=lambda item: item[1][2].sum, reverse=True)
+            return {
+                "uptime_seconds": round(time.time() - self._started, 1),
+                "tools": tools,
+                "sql": [
+                    {"sql": sql, "calls": calls, "rows": rows,
+                     "total_ms": round(hist.sum * 1000, 3), **hist.summary()}
+                    for sql, (calls, rows, hist) in statements[:top]
+                ],
+                "sql_statements_tracked": len(self._statements),
+                "slow_query_ms": self.slow_query_ms,
+                "slow_queries": list(self._slow),
+            }
+
+    def prometheus(self, gauges=None):
+        '''Render all metrics in the Prometheus text exposition format.'''
+        lines = []
+        with self._lock:
+            tools = [(name, *stats) for name, stats in sorted(self._tools.items())]
+            statements = [(sql, *stats) for sql, stats in sorted(self._statements.items())]
+            self._render(lines, tools, statements)
+        for name, value in (gauges or {}).items():
+            _family(lines, f"expense_tracker_{name}", "gauge", name.replace("_", " "), [({}, value)])
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _render(lines, tools, statements):
+        _family(lines, "expense_tracker_tool_calls_total", "counter", "Tool calls",
+                (({"tool": name}, calls) for name, calls, _, _ in tools))
+        _family(lines, "expense_tracker_tool_errors_total", "counter", "Tool calls that returned or raised an error",
+                (({"tool": name}, errors) for name, _, errors, _ in tools))
+        _histogram(lines, "expense_tracker_tool_duration_seconds", "Tool call latency",
+                   (({"tool": name}, hist) for name, _, _, hist in tools))
+        _family(lines, "expense_tracker_sql_rows_total", "counter", "Rows returned or changed per SQL statement",
+                (({"statement": sql}, rows) for sql, _, rows, _ in statements))
+        _histogram(lines, "expense_tracker_sql_duration_seconds", "SQL statement latency",
+                   (({"statement": sql}, hist) for sql, _, _, hist in statements))
+
+    def write_prometheus(self, path, gauges=None):
+        '''Atomically replace path with the current metrics.'''
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(self.prometheus(gauges))
+        os.replace(tmp, path)
+        return str(path)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+def _family(lines, name, kind, help_text, samples):
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} {kind}")
+    for labels, value in samples:
+        lines.append(f"{name}{_labels(labels)} {value}")
+
+
+def _histogram(lines, name, help_text, samples):
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} histogram")
+    for labels, hist in samples:
+        cumulative = 0
+        for upper, count in zip(hist.buckets, hist.counts):
+            cumulative += count
+            le = "+Inf" if upper == float("inf") else repr(upper)
+            lines.append(f"{name}_bucket{_labels({**labels, 'le': le})} {cumulative}")
+        lines.append(f"{name}_sum{_labels(labels)} {hist.sum}")
+        lines.append(f"{name}_count{_labels(labels)} {hist.count}")
+
+
+def explain(conn, sql, params):
+    '''Return EXPLAIN QUERY PLAN rows for sql, or None if it cannot be explained.'''
+    if params is None or not sql.lstrip().upper().startswith(_EXPLAINABLE):
+        return None
+    try:
+        # A plain cursor, so the EXPLAIN itself is not timed
+        rows = sqlite3.Cursor(conn).execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+    except sqlite3.Error as e:
+        return [f"EXPLAIN failed: {e}"]
+    return [row[-1] for row in rows]
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    '''Cursor that reports each statement's duration and row count to metrics.
+
+    A statement is timed from execute() until its rows are exhausted, the cursor
+    is reused or closed. Statements without a result set finish in execute().
+    '''
+
+    _sql = None
+
+    def execute(self, sql, parameters=()):
+        self._finish()
+        self._sql, self._params, self._rows = sql, parameters, 0
+        self._start = time.perf_counter()
+        try:
+            super().execute(sql, parameters)
+        except Exception:
+            self._finish()
+            raise
+        if self.description is None:
+            self._rows = max(self.rowcount, 0)
+            self._finish()
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        self._finish()
+        start = time.perf_counter()
+        try:
+            super().executemany(sql, seq_of_parameters)
+        finally:
+            metrics.record_sql(self.connection, sql, None, time.perf_counter() - start, max(self.rowcount, 0))
+        return self
+
+    def fetchone(self):
+        row = super().fetchone()
+        if row is None:
+            self._finish()
+        else:
+            self._rows += 1
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        rows = super().fetchmany(size)
+        self._rows += len(rows)
+        if len(rows) < size:
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        rows = super().fetchall()
+        self._rows += len(rows)
+        self._finish()
+        return rows
+
+    def __next__(self):
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._finish()
+            raise
+        self._rows += 1
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        self._finish()
+
+    def _finish(self):
+        sql = self._sql
+        if sql is None:
+            return
+        self._sql = None
+        try:
+            metrics.record_sql(self.connection, sql, self._params, time.perf_counter() - self._start, self._rows)
+        except Exception as e:
+            logger.debug("Could not record SQL metrics: %s", e)
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    '''Connection whose cursors (including conn.execute shortcuts) are instrumented.'''
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+def connection_factory():
+    '''sqlite3.connect factory for pooled connections.'''
+    return InstrumentedConnection if sql_metrics_enabled() else sqlite3.Connection
+
+
+def _is_error(result):
+    return isinstance(result, dict) and result.get("status") == "error"
+
+
+def instrument(mcp):
+    '''Return a drop-in replacement for mcp.tool that records per-tool metrics.'''
+    def tool(*args, **kwargs):
+        def decorator(fn):
+            name = fn.__name__
+            if inspect.iscoroutinefunction(fn):
+                @functools.wraps(fn)
+                async def wrapper(*a, **kw):
+                    start = time.perf_counter()
+                    error = True
+                    try:
+                        result = await fn(*a, **kw)
+                        error = _is_error(result)
+                        return result
+                    finally:
+                        metrics.record_tool(name, time.perf_counter() - start, error)
+            else:
+                @functools.wraps(fn)
+                def wrapper(*a, **kw):
+                    start = time.perf_counter()
+                    error = True
+                    try:
+                        result = fn(*a, **kw)
+                        error = _is_error(result)
+                        return result
+                    finally:
+                        metrics.record_tool(name, time.perf_counter() - start, error)
+            return mcp.tool(*args, **kwargs)(wrapper)
+        return decorator
+    return tool
+
+
+def dump_on_exit():
+    path = os.environ.get(METRICS_FILE_ENV)
+    if path:
+        try:
+            metrics.write_prometheus(path)
+        except OSError as e:
+            logger.error("Could not write metrics to %s: %s", path, e)
+
+
+metrics = Metrics()
+atexit.register(dump_on_exit)
@@ -0,0 +1,95 @@
+import base64
+import binascii
+import json
+from itertools import islice
+
+from .compact import FULL, row_encoder
+from .db import AMOUNT_CENTS
+
+# Columns a listing tool may return, in response order
+EXPENSE_COLUMNS = ("id", "date", "amount", "currency", "category", "subcategory", "note")
+
+# Columns read through an expression; amount is fetched in cents and converted per row
+COLUMN_SQL = {"amount": AMOUNT_CENTS}
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+def encode_cursor(*key):
+    '''Opaque cursor pointing just past the sort key, e.g. (date, id), of the last returned row.'''
+    raw = json.dumps(list(key), separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor, kinds=(str, int)):
+    '''Inverse of encode_cursor(), checking each key part against kinds.
+    Raises ValueError for anything it did not produce.'''
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        key = json.loads(base64.urlsafe_b64decode(padded))
+        if not isinstance(key, list) or len(key) != len(kinds):
+            raise TypeError
+        if not all(isinstance(part, kind) for part, kind in zip(key, kinds)):
+            raise TypeError
+        return tuple(key)
+    except (binascii.Error, TypeError, ValueError):
+        raise ValueError("Invalid cursor") from None
+
+
+def page_size(limit):
+    '''Clamp a requested page size to 1..MAX_PAGE_SIZE.'''
+    if limit is None:
+        return DEFAULT_PAGE_SIZE
+    return max(1, min(int(limit), MAX_PAGE_SIZE))
+
+
+def projection(columns):
+    '''Validate requested columns; None or empty means all of EXPENSE_COLUMNS.'''
+    if not columns:
+        return list(EXPENSE_COLUMNS)
+    unknown = [col for col in columns if col not in EXPENSE_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown columns {unknown}, expected any of {list(EXPENSE_COLUMNS)}")
+    return [col for col in EXPENSE_COLUMNS if col in columns]
+
+
+def paginate(conn, where="", params=(), limit=None, cursor=None, columns=None, fmt=FULL):
+    '''Fetch one page of expenses, newest first, using keyset pagination on (date, id).
+
+    `where` is an optional SQL predicate over expenses with `params` bound to it.
+    Rows are read from the SQLite cursor one at a time and only the page is kept;
+    one extra row is peeked to set has_more, so no COUNT(*) is ever run.
+    With a compact fmt, expenses are row arrays in the order of the returned columns.
+    '''
+    size = page_size(limit)
+    selected = projection(columns)
+    conditions = [f"({where})"] if where else []
+    params = list(params)
+    if cursor:
+        conditions.append("(date, id) < (?, ?)")
+        params.extend(decode_cursor(cursor))
+
+    # date and id are always read so the next cursor can be built
+    query = f"SELECT date, id, {', '.join(COLUMN_SQL.get(col, col) for col in selected)} FROM expenses"
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += " ORDER BY date DESC, id DESC LIMIT ?"
+    params.append(size + 1)
+
+    cur = conn.execute(query, params)
+    expenses = []
+    last = None
+    encode = row_encoder(selected, fmt)
+    for row in islice(cur, size):
+        last = row
+        expenses.append(encode(row[2:]))
+    has_more = cur.fetchone() is not None
+    cur.close()
+
+    return {
+        **({"format": "compact", "columns": selected} if fmt.compact else {}),
+        "expenses": expenses,
+        "has_more": has_more,
+        "next_cursor": encode_cursor(last[0], last[1]) if has_more else None,
+    }
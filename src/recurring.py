@@ -0,0 +1,122 @@
+import calendar
+import datetime
+import logging
+
+from .db import MINOR_UNITS, normalize_currency, normalize_date, to_cents
+
+logger = logging.getLogger(__name__)
+
+FREQUENCIES = ("daily", "weekly", "monthly", "yearly")
+
+# Occurrences written per write job, so a long backlog never holds the writer for long
+MATERIALIZE_BATCH_SIZE = 500
+
+_INSERT_OCCURRENCE = """
+    INSERT OR IGNORE INTO expenses(date, amount, amount_cents, currency, category, subcategory, note, recurring_id)
+    VALUES (?,?,?,?,?,?,?,?)
+"""
+
+
+def occurrence(start, frequency, interval, n):
+    '''Date of the n-th occurrence (0 = start) of a schedule.
+
+    Monthly and yearly steps are counted from start, so a schedule starting on
+    the 31st lands on the last day of shorter months and returns to the 31st.
+    '''
+    step = n * interval
+    if frequency == "daily":
+        return start + datetime.timedelta(days=step)
+    if frequency == "weekly":
+        return start + datetime.timedelta(weeks=step)
+    months = step if frequency == "monthly" else 12 * step
+    year, month = divmod(start.month - 1 + months, 12)
+    year += start.year
+    return start.replace(year=year, month=month + 1, day=min(start.day, calendar.monthrange(year, month + 1)[1]))
+
+
+def normalize_template(amount, category, frequency="monthly", start_date=None, interval=1, end_date=None,
+                       subcategory="", note="", currency=None):
+    '''Validate a recurring expense and return its recurring_expenses column values.'''
+    frequency = str(frequency or "").strip().lower()
+    if frequency not in FREQUENCIES:
+        raise ValueError(f"Invalid frequency '{frequency}', expected one of {', '.join(FREQUENCIES)}")
+    interval = int(interval)
+    if interval < 1:
+        raise ValueError("interval must be at least 1")
+    category = str(category or "").strip().lower()
+    if not category:
+        raise ValueError("Category is required")
+    start = normalize_date(start_date or datetime.date.today())
+    end = normalize_date(end_date) if end_date else None
+    if end is not None and end < start:
+        raise ValueError("end_date is before start_date")
+    return {
+        "amount_cents": to_cents(amount),
+        "currency": normalize_currency(currency),
+        "category": category,
+        "subcategory": str(subcategory or "").lower(),
+        "note": str(note or "").lower(),
+        "frequency": frequency,
+        "interval": interval,
+        "start_date": start,
+        "end_date": end,
+        "next_date": start,
+    }
+
+
+def add_template(conn, template):
+    '''Insert a template from normalize_template(). Runs inside the caller's transaction.'''
+    columns = ", ".join(template)
+    return conn.execute(
+        f"INSERT INTO recurring_expenses({columns}) VALUES ({', '.join('?' * len(template))})",
+        list(template.values())
+    ).lastrowid
+
+
+def has_due(conn, until):
+    # Served by the partial index idx_recurring_due
+    return conn.execute(
+        "SELECT EXISTS(SELECT 1 FROM recurring_expenses WHERE active = 1 AND next_date <= ?)", (until,)
+    ).fetchone()[0]
+
+
+def materialize_due(conn, until, batch_size=MATERIALIZE_BATCH_SIZE):
+    '''Write up to batch_size due occurrences (dated on or before until) as expenses.
+
+    Runs inside the caller's transaction: each template's next_date advances in
+    the same commit as the expenses it wrote, and the unique (recurring_id, date)
+    index turns an occurrence that is already there into a no-op, so running
+    this again after a crash or restart never duplicates an expense.
+    Returns {"created", "months", "more"}.
+    '''
+    created = 0
+    months = set()
+    templates = conn.execute("""
+        SELECT * FROM recurring_expenses
+        WHERE active = 1 AND next_date <= ?
+        ORDER BY next_date, id
+        LIMIT ?
+    """, (until, batch_size)).fetchall()
+    for template in templates:
+        start = datetime.date.fromisoformat(template["start_date"])
+        n = template["occurrences"]
+        day = template["next_date"]
+        while day is not None and day <= until and created < batch_size:
+            inserted = conn.execute(_INSERT_OCCURRENCE, (
+                day, template["amount_cents"] / MINOR_UNITS, template["amount_cents"], template["currency"],
+                template["category"], template["subcategory"], template["note"], template["id"],
+            )).rowcount
+            if inserted:
+                created += 1
+                months.add(day[:7])
+            n += 1
+            day = occurrence(start, template["frequency"], template["interval"], n).isoformat()
+            if template["end_date"] and day > template["end_date"]:
+                day = None
+        conn.execute("UPDATE recurring_expenses SET occurrences = ?, next_date = ? WHERE id = ?",
+                     (n, day, template["id"]))
+        if created >= batch_size:
+            break
+    if created:
+        logger.info("Materialized %s recurring expenses up to %s", created, until)
+    return {"created": created, "months": sorted(months), "more": bool(has_due(conn, until))}
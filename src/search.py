@@ -0,0 +1,101 @@
+import logging
+import re
+from itertools import islice
+
+from .compact import FULL, row_encoder
+from .pagination import COLUMN_SQL, decode_cursor, encode_cursor, page_size, projection
+
+logger = logging.getLogger(__name__)
+
+# bm25 weights for the indexed columns: note, subcategory, category
+BM25_WEIGHTS = (4.0, 2.0, 1.0)
+
+_SCORE = f"bm25(expenses_fts, {', '.join(map(str, BM25_WEIGHTS))})"
+
+# "quoted phrase" or a bare word
+_TOKEN = re.compile(r'"([^"]*)"|(\S+)')
+
+
+def _quote(text):
+    return '"' + text.replace('"', '""') + '"'
+
+
+def fts_query(text):
+    '''Translate user search text into an FTS5 MATCH expression.
+
+    Words are ANDed, "quoted text" is a phrase, a trailing * makes a prefix
+    term (coff*) and OR between two terms is kept. Everything else is quoted,
+    so FTS5 operators and punctuation in the input never cause syntax errors.
+    '''
+    terms = []
+    for phrase, word in _TOKEN.findall(text or ""):
+        if phrase.strip():
+            terms.append(_quote(phrase.strip()))
+        elif word == "OR":
+            if terms and terms[-1] != "OR":
+                terms.append("OR")
+        elif word.rstrip("*"):
+            terms.append(_quote(word.rstrip("*")) + ("*" if word.endswith("*") else ""))
+    while terms and terms[-1] == "OR":
+        terms.pop()
+    if not terms:
+        raise ValueError("Search query is empty")
+    return " ".join(terms)
+
+
+def search_expenses(conn, query, where="", params=(), limit=None, cursor=None, columns=None, fmt=FULL):
+    '''Fetch one page of expenses matching query, best bm25 match first.
+
+    `where` is an optional SQL predicate over the joined expenses row (alias e).
+    Pages are keyed on (score, id) like paginate() keys on (date, id).
+    '''
+    size = page_size(limit)
+    selected = projection(columns)
+    conditions = ["expenses_fts MATCH ?"]
+    args = [fts_query(query)]
+    if where:
+        conditions.append(f"({where})")
+        args.extend(params)
+    if cursor:
+        score, expense_id = decode_cursor(cursor, ((int, float), int))
+        conditions.append(f"({_SCORE} > ? OR ({_SCORE} = ? AND e.id > ?))")
+        args += [score, score, expense_id]
+
+    select = ", ".join(COLUMN_SQL.get(col, f"e.{col}") for col in selected)
+    sql = f"""
+        SELECT {_SCORE} AS score, e.id, {select}
+        FROM expenses_fts JOIN expenses e ON e.id = expenses_fts.rowid
+        WHERE {' AND '.join(conditions)}
+        ORDER BY score, e.id
+        LIMIT ?
+    """
+    args.append(size + 1)
+
+    cur = conn.execute(sql, args)
+    expenses = []
+    last = None
+    encode = row_encoder(selected, fmt)
+    for row in islice(cur, size):
+        last = row
+        expenses.append(encode(row[2:]))
+    has_more = cur.fetchone() is not None
+    cur.close()
+
+    return {
+        **({"format": "compact", "columns": selected} if fmt.compact else {}),
+        "expenses": expenses,
+        "has_more": has_more,
+        "next_cursor": encode_cursor(last[0], last[1]) if has_more else None,
+    }
+
+
+def rebuild_search_index(conn):
+    '''Rebuild expenses_fts from the expenses table and merge its segments.
+
+    Runs inside the caller's transaction. Returns the number of indexed rows.
+    '''
+    conn.execute("INSERT INTO expenses_fts(expenses_fts) VALUES ('rebuild')")
+    conn.execute("INSERT INTO expenses_fts(expenses_fts) VALUES ('optimize')")
+    indexed = conn.execute("SELECT COUNT(*) FROM expenses").fetchone()[0]
+    logger.info("Rebuilt search index over %s expenses", indexed)
+    return indexed
@@ -0,0 +1,350 @@
+import datetime
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from .db import AMOUNT_CENTS, average_amount, init_db, normalize_date, to_amount
+
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 1
+
+# column -> (array typecode, numpy dtype); one flat file per column, rows in id order
+COLUMNS = {
+    "date": ("i", "i4"),         # days since 1970-01-01
+    "amount": ("q", "i8"),       # integer cents
+    "category": ("i", "i4"),     # index into meta["categories"]
+    "subcategory": ("i", "i4"),  # index into meta["subcategories"]
+}
+
+META_FILE = "snapshot.json"
+
+# Rows fetched from SQLite and appended per write
+EXPORT_BATCH_SIZE = 50_000
+
+# Keys analyze() can group by
+GROUP_KEYS = ("category", "subcategory", "year", "month", "weekday")
+
+# Group-bys with at most this many possible key combinations count into dense arrays
+DENSE_GROUPS = 1 << 22
+
+_EPOCH = datetime.date(1970, 1, 1).toordinal()
+_WEEKDAYS = ("monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday")
+
+# One export at a time; exports are rare and each rewrites the metadata file
+_export_lock = threading.Lock()
+
+# Exports run on their own thread, so a long one never holds a read pool worker
+export_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="snapshot-export")
+
+
+def _numpy():
+    '''numpy, imported on first use: it is optional (the "analytics" extra) and
+    costs more to import than the rest of the server, so startup never pays for it.'''
+    try:
+        import numpy
+    except ImportError:
+        raise RuntimeError("Snapshot analytics need numpy; install it with the 'analytics' extra") from None
+    return numpy
+
+
+def snapshot_path(db_path):
+    '''Directory holding the snapshot of the database at db_path.'''
+    return Path(f"{db_path}.snapshot")
+
+
+def day_number(value):
+    return datetime.date.fromisoformat(normalize_date(value)).toordinal() - _EPOCH
+
+
+def _column_file(directory, column):
+    return Path(directory) / f"{column}.bin"
+
+
+def read_meta(directory):
+    path = Path(directory) / META_FILE
+    if not path.exists():
+        return None
+    meta = json.loads(path.read_text(encoding="utf-8"))
+    if meta.get("format") != FORMAT_VERSION:
+        raise RuntimeError(f"Snapshot {directory} has format {meta.get('format')}, expected {FORMAT_VERSION}")
+    return meta
+
+
+def _write_meta(directory, meta):
+    '''Atomically replace the metadata; rows beyond meta["rows"] in the column files are ignored.'''
+    path = Path(directory) / META_FILE
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(meta), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def _empty_meta():
+    return {
+        "format": FORMAT_VERSION,
+        "byteorder": sys.byteorder,
+        "columns": {column: dtype for column, (_, dtype) in COLUMNS.items()},
+        "rows": 0,
+        "last_id": 0,
+        "total_cents": 0,
+        "categories": [],
+        "subcategories": [],
+    }
+
+
+def _changes(conn):
+    return conn.execute("SELECT changes FROM expense_changes WHERE id = 1").fetchone()[0]
+
+
+def _is_current(conn, meta, changes):
+    '''Whether the exported rows still match expenses up to last_id.
+
+    changes is the counter the triggers of migration 8 bump on every delete
+    and every edit to an exported column, so this is two lookups rather than a
+    scan of the exported rows. Any such change counts, including one to a row
+    not exported yet, and means a rewrite.
+    '''
+    max_id = conn.execute("SELECT MAX(id) FROM expenses").fetchone()[0] or 0
+    return meta.get("changes") == changes and max_id >= meta["last_id"]
+
+
+def export_snapshot(conn, directory, rebuild=False, batch_size=EXPORT_BATCH_SIZE):
+    '''Append expenses added since the last export to the columnar snapshot in directory.
+
+    Runs on a read connection. The whole snapshot is rewritten when rebuild is
+    set, when none exists yet, or when expenses were deleted or had their date,
+    amount, category or subcategory edited since the last export. Column files
+    are appended first and the metadata replaced last, so a failed export
+    leaves the previous snapshot readable.
+    '''
+    directory = Path(directory)
+    with _export_lock:
+        directory.mkdir(parents=True, exist_ok=True)
+        # One read transaction, so the check and the rows exported agree
+        conn.execute("BEGIN")
+        try:
+            changes = _changes(conn)
+            meta = None if rebuild else read_meta(directory)
+            rebuilt = meta is None
+            if meta is not None and (meta["byteorder"] != sys.byteorder or not _is_current(conn, meta, changes)):
+                logger.info("Snapshot %s is out of date, rewriting it", directory)
+                meta, rebuilt = None, True
+            if meta is None:
+                # Without metadata an interrupted rewrite is never mistaken for a valid snapshot
+                (directory / META_FILE).unlink(missing_ok=True)
+                meta = _empty_meta()
+
+            appended = _append(conn, directory, meta, batch_size)
+            meta["changes"] = changes
+        finally:
+            conn.rollback()
+        _write_meta(directory, meta)
+
+    logger.info("Exported %s expenses to snapshot %s (%s rows)", appended, directory, meta["rows"])
+    return {
+        "path": str(directory),
+        "rows": meta["rows"],
+        "appended": appended,
+        "rebuilt": rebuilt,
+        "last_id": meta["last_id"],
+        "bytes": sum(_column_file(directory, column).stat().st_size for column in COLUMNS),
+    }
+
+
+def export_database(db_path, rebuild=False, batch_size=EXPORT_BATCH_SIZE):
+    '''export_snapshot() of the database at db_path into snapshot_path(db_path).
+
+    Uses a private read-only connection, so it can run on export_executor
+    instead of the read pool.
+    '''
+    init_db(db_path)
+    conn = sqlite3.connect(f"{Path(db_path).resolve().as_uri()}?mode=ro", uri=True)
+    try:
+        return export_snapshot(conn, snapshot_path(db_path), rebuild, batch_size)
+    finally:
+        conn.close()
+
+
+def _append(conn, directory, meta, batch_size):
+    codes = {
+        "category": {name: i for i, name in enumerate(meta["categories"])},
+        "subcategory": {name: i for i, name in enumerate(meta["subcategories"])},
+    }
+    labels = {"category": meta["categories"], "subcategory": meta["subcategories"]}
+
+    def code(column, value):
+        index = codes[column].get(value)
+        if index is None:
+            index = codes[column][value] = len(labels[column])
+            labels[column].append(value)
+        return index
+
+    files = {}
+    try:
+        for column, (typecode, _) in COLUMNS.items():
+            path = _column_file(directory, column)
+            if not meta["rows"]:
+                # A new file rather than truncating one a reader may still have mapped
+                path.unlink(missing_ok=True)
+            f = files[column] = open(path, "r+b" if meta["rows"] else "w+b")
+            # Drop whatever an interrupted export wrote past the recorded rows
+            f.truncate(meta["rows"] * array(typecode).itemsize)
+            f.seek(0, os.SEEK_END)
+
+        cur = conn.execute(f"""
+            SELECT id, CAST(julianday(date) - 2440587.5 AS INTEGER), {AMOUNT_CENTS}, category, COALESCE(subcategory, '')
+            FROM expenses
+            WHERE id > ?
+            ORDER BY id
+        """, (meta["last_id"],))
+        appended = 0
+        while rows := cur.fetchmany(batch_size):
+            ids, days, cents, categories, subcategories = zip(*rows)
+            batch = {
+                "date": days,
+                "amount": cents,
+                "category": [code("category", name) for name in categories],
+                "subcategory": [code("subcategory", name) for name in subcategories],
+            }
+            for column, (typecode, _) in COLUMNS.items():
+                array(typecode, batch[column]).tofile(files[column])
+            meta["total_cents"] += sum(cents)
+            meta["last_id"] = ids[-1]
+            appended += len(rows)
+        for f in files.values():
+            f.flush()
+            os.fsync(f.fileno())
+    finally:
+        for f in files.values():
+            f.close()
+
+    meta["rows"] += appended
+    meta["exported_at"] = datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds")
+    return appended
+
+
+def open_snapshot(directory):
+    '''(meta, {column: read-only memory-mapped numpy array}) for the snapshot in directory.'''
+    np = _numpy()
+    meta = read_meta(directory)
+    if meta is None:
+        raise FileNotFoundError(f"No snapshot at {directory}, run export_snapshot first")
+    order = "<" if meta["byteorder"] == "little" else ">"
+    columns = {}
+    for column, dtype in meta["columns"].items():
+        dtype = np.dtype(order + dtype)
+        if meta["rows"]:
+            columns[column] = np.memmap(_column_file(directory, column), dtype=dtype, mode="r", shape=(meta["rows"],))
+        else:
+            columns[column] = np.empty(0, dtype=dtype)
+    return meta, columns
+
+
+def _group_key(key, columns, meta):
+    '''(integer codes, code -> label) for one group-by key.'''
+    np = _numpy()
+    days = columns["date"]
+    if key in ("category", "subcategory"):
+        names = meta["categories" if key == "category" else "subcategories"]
+        return columns[key], lambda code: names[code]
+    if key == "year":
+        return days.astype("datetime64[D]").astype("datetime64[Y]").astype(np.int64), lambda y: str(1970 + y)
+    if key == "month":
+        return (days.astype("datetime64[D]").astype("datetime64[M]").astype(np.int64),
+                lambda m: f"{1970 + m // 12:04d}-{m % 12 + 1:02d}")
+    if key == "weekday":
+        # 1970-01-01 was a Thursday
+        return (days + 3) % 7, lambda d: _WEEKDAYS[d]
+    raise ValueError(f"Cannot group by {key!r}, use any of {', '.join(GROUP_KEYS)}")
+
+
+def analyze(directory, group_by=("category",), start_date=None, end_date=None, category=None, limit=None):
+    '''Totals and counts per group over the snapshot, computed with vectorized NumPy.
+
+    Filters build one boolean mask over the memory-mapped columns; the group
+    keys are packed into one integer per row and summed with np.bincount.
+    Totals are summed as float64, exact up to 2**53 cents per group.
+    Groups come back largest total first.
+    '''
+    group_by = list(dict.fromkeys(group_by or ()))
+    for key in group_by:
+        if key not in GROUP_KEYS:
+            raise ValueError(f"Cannot group by {key!r}, use any of {', '.join(GROUP_KEYS)}")
+    np = _numpy()
+    meta, columns = open_snapshot(directory)
+
+    mask = None
+    conditions = []
+    if start_date:
+        conditions.append(lambda: columns["date"] >= day_number(start_date))
+    if end_date:
+        conditions.append(lambda: columns["date"] <= day_number(end_date))
+    if category:
+        name = category.strip().lower()
+        code = meta["categories"].index(name) if name in meta["categories"] else -1
+        conditions.append(lambda: columns["category"] == code)
+    for condition in conditions:
+        mask = condition() if mask is None else mask & condition()
+    if mask is not None:
+        columns = {column: values[mask] for column, values in columns.items()}
+    amounts = columns["amount"]
+
+    # Pack the group codes of every row into one integer (mixed radix)
+    keys = [_group_key(key, columns, meta) for key in group_by]
+    packed = np.zeros(len(amounts), dtype=np.int64)
+    radix = []
+    for codes, _ in keys:
+        low = int(codes.min()) if len(codes) else 0
+        size = int(codes.max()) - low + 1 if len(codes) else 1
+        packed = packed * size + (codes - low)
+        radix.append((low, size))
+
+    combinations = 1
+    for _, size in radix:
+        combinations *= size
+    if combinations <= DENSE_GROUPS:
+        counts = np.bincount(packed, minlength=combinations)
+        totals = np.bincount(packed, weights=amounts, minlength=combinations)
+        groups = np.flatnonzero(counts)
+        counts, totals = counts[groups], totals[groups]
+    else:
+        groups, inverse = np.unique(packed, return_inverse=True)
+        counts = np.bincount(inverse)
+        totals = np.bincount(inverse, weights=amounts)
+
+    order = np.argsort(-totals, kind="stable")
+    if limit is not None:
+        order = order[:limit]
+
+    results = []
+    for i in order.tolist():
+        rest = int(groups[i])
+        labels = []
+        for (low, size), (_, label) in zip(reversed(radix), reversed(keys)):
+            labels.append(label(rest % size + low))
+            rest //= size
+        total = int(round(totals[i]))
+        count = int(counts[i])
+        results.append({
+            **dict(zip(group_by, reversed(labels))),
+            "total": to_amount(total),
+            "count": count,
+            "average": average_amount(total, count),
+        })
+
+    total = int(amounts.sum())
+    return {
+        "rows": meta["rows"],
+        "last_id": meta["last_id"],
+        "exported_at": meta.get("exported_at"),
+        "matched": len(amounts),
+        "total_amount": to_amount(total),
+        "groups": len(groups),
+        "results": results,
+    }
@@ -1,438 +1,875 @@
-import sqlite3
-from .db import init_db
+from .budgets import DEFAULT_ALERT_PERCENT, budget_status, normalize_budget
+from .budgets import remove_budget as remove_budget_row
+from .budgets import set_budget as save_budget
+from .bulk import delete_matching, expense_filter, normalize_changes, preview, update_matching
+from .db import INSERT_EXPENSE, normalize_date, normalize_expense, rebuild_rollups
+from .db import average_amount, money, to_amount
+from .db import months_filter, period_months, pool
+from .db import verify_rollups as check_rollups
+from .cache import result_cache
+from .compact import compact_response, parse_format
+from .executor import BULK_TIMEOUT, db_executor
+from .ledgers import Ledgers
+from .importer import DEFAULT_BATCH_SIZE
+from .importer import import_expenses as run_import
+from .logging_config import tracing_enabled
+from .maintenance import materialize_recurring
+from .metrics import METRICS_FILE_ENV, instrument, metrics
+from .pagination import DEFAULT_PAGE_SIZE, paginate
+from .recurring import add_template, normalize_template
+from .search import rebuild_search_index as run_search_rebuild
+from .search import search_expenses as run_search
+from .snapshot import analyze, export_database, export_executor, snapshot_path
+from .trends import covered_months, generate_periods, parse_period, spending_trends
 from pathlib import Path
+from typing import Annotated
+import asyncio
 import logging
+import os
 
 logger = logging.getLogger(__name__)
 
-# Sqlite DB Path
-DB_PATH = Path(__file__).parent.parent / "expense.db"
+# Sqlite DB Path of the default ledger; set EXPENSE_TRACKER_DB to use another file (created and migrated on first use)
+DB_PATH = Path(os.environ.get("EXPENSE_TRACKER_DB", Path(__file__).parent.parent / "expense.db"))
 
-# Init DB if not exists 
-init_db(DB_PATH)
+# Every other ledger is its own file in this directory; set EXPENSE_TRACKER_LEDGER_DIR to move them
+LEDGER_DIR = Path(os.environ.get("EXPENSE_TRACKER_LEDGER_DIR", DB_PATH.parent / "ledgers"))
+
+ledgers = Ledgers(DB_PATH, LEDGER_DIR)
+
+# The ledger parameter every data tool takes
+Ledger = Annotated[str | None, "Ledger (tenant) to use, e.g. a user name; omit for the default ledger. New ledgers are created on first use."]
+
+# Response format parameters of the listing and analytics tools
+Format = Annotated[str, '"full" (default) returns lists of objects; "compact" returns each list as a columns header plus row arrays']
+Decimals = Annotated[int | None, "Compact format only: round amounts to this many decimal places (0 for whole units)"]
+OmitEmpty = Annotated[bool, "Compact format only: leave empty subcategory and note values off the end of each row"]
+
+# SQL tracing and per-call file checks are diagnostics only
+TRACE = tracing_enabled()
 
 # Log SQL query
 def log_sql(statement):
-    logger.debug(f"SQL executed: {statement}")
+    logger.debug("SQL executed: %s", statement)
 
 def register_tools(mcp):
     """Register all expense tracking tools with the MCP server"""
     
     # Test logging when tools are registered
     logger.info("=== Registering expense tracking tools ===")
-    logger.debug(f"Database path: {DB_PATH}")
-    logger.debug(f"Database exists: {DB_PATH.exists()}")
+    # Every tool is registered through this wrapper so its calls are timed
+    tool = instrument(mcp)
+    logger.debug("Database path: %s, ledger directory: %s", DB_PATH, LEDGER_DIR)
+    if TRACE:
+        logger.debug("Database exists: %s", DB_PATH.exists())
     
-    @mcp.tool()
-    def add_expense(date: str, amount: float, category: str, subcategory="", note=""):
-        '''Add a new expense entry to the database.'''
-        logger.debug(f"add_expense called: {amount} for {category} on {date}")
-        logger.debug(f"Connecting to database at: {DB_PATH}")
+    @tool()
+    async def add_expense(date: str, amount: float, category: str, subcategory="", note="", currency: str | None = None, ledger: Ledger = None):
+        '''Add a new expense entry to the database. currency is an optional 3-letter code (e.g. USD).'''
+        logger.debug("add_expense called: %s for %s on %s", amount, category, date)
         
         try:
-            with sqlite3.connect(DB_PATH) as c:
-                cur = c.execute(
-                    "INSERT INTO expenses(date, amount, category, subcategory, note) VALUES (?,?,?,?,?)",
-                    (date.lower(), amount, category.lower(), subcategory.lower(), note.lower())
-                )
-                expense_id = cur.lastrowid
-                logger.info(f"Successfully added expense with ID: {expense_id}")
-                return {"status": "ok", "id": expense_id}
+            db_path = ledgers.path(ledger)
+            row = normalize_expense(date, amount, category, subcategory, note, currency)
+            
+            def insert(conn):
+                return conn.execute(INSERT_EXPENSE, row).lastrowid
+            
+            expense_id = await db_executor.write(db_path, insert)
+            result_cache.invalidate([row[0][:7]], db_path)
+            logger.info("Successfully added expense with ID: %s", expense_id)
+            return {"status": "ok", "id": expense_id}
         except Exception as e:
-            logger.error(f"Error adding expense: {e}")
+            logger.error("Error adding expense: %s", e)
             return {"status": "error", "message": str(e)}
 
-    @mcp.tool()
-    def get_all_expenses():
-        """Retrieve all expenses from the database"""
-        logger.debug("=== get_all_expenses called ===")
-        logger.debug(f"Connecting to database at: {DB_PATH}")
-        logger.debug(f"Database file exists: {DB_PATH.exists()}")
+    @tool()
+    async def get_all_expenses(limit: int = DEFAULT_PAGE_SIZE, cursor: str | None = None, columns: list[str] | None = None,
+                               response_format: Format = "full", decimals: Decimals = None, omit_empty: OmitEmpty = False,
+                               ledger: Ledger = None):
+        """Retrieve expenses from the database, newest first, one page at a time.
+        Pass next_cursor from the previous response as cursor to get the next page; columns selects a subset of fields."""
+        logger.debug("=== get_all_expenses called: ledger=%s ===", ledger)
         
+        def fetch(conn):
+            page = paginate(conn, limit=limit, cursor=cursor, columns=columns, fmt=fmt)
+            
+            logger.info("Successfully retrieved %s expenses", len(page['expenses']))
+            logger.debug("=== get_all_expenses completed ===")
+            
+            return {"status":"Ok", **page}
+
         try:
-            with sqlite3.connect(DB_PATH) as conn:
-                conn.row_factory = sqlite3.Row
-                
-                # Check if table exists
-                table_check = conn.execute(
-                    "SELECT name FROM sqlite_master WHERE type='table' AND name='expenses'"
-                ).fetchone()
-                logger.debug(f"Table 'expenses' exists: {table_check is not None}")
-                
-                if not table_check:
-                    logger.error("Table 'expenses' does not exist!")
-                    return {"status": "error", "message": "Table 'expenses' not found"}
-                
-                cur = conn.execute("SELECT * FROM expenses ORDER BY date DESC")
-                expenses = [dict(row) for row in cur.fetchall()]
-                
-                logger.info(f"Successfully retrieved {len(expenses)} expenses")
-                logger.debug("=== get_all_expenses completed ===")
-                
-                return {"status":"Ok", "expenses":expenses}
+            db_path = ledgers.path(ledger)
+            fmt = parse_format(response_format, decimals, omit_empty)
+            if TRACE:
+                logger.debug("Connecting to database at: %s", db_path)
+                logger.debug("Database file exists: %s", db_path.exists())
+            return await db_executor.read(db_path, fetch)
                 
         except Exception as e:
-            logger.error(f"Error retrieving expenses: {e}", exc_info=True)
+            logger.error("Error retrieving expenses: %s", e, exc_info=True)
             return {"status": "error", "message": str(e)}
     
     logger.info("=== All tools registered successfully ===")
 
-    @mcp.tool()
-    def get_expenses_by_category(category: str):
-        '''Retrieve expenses filtered by category.'''
-        logger.debug("=== get_expenses_by_category called ===")
-        logger.debug(f"Connecting to database at: {DB_PATH}")
-        logger.debug(f"Database file exists: {DB_PATH.exists()}")
-        with sqlite3.connect(DB_PATH) as c:
-            c.row_factory = sqlite3.Row
-            cur = c.execute("SELECT * FROM expenses WHERE category = ? ORDER BY date DESC", (category.lower()))
-            expenses = [dict(row) for row in cur.fetchall()]
-            return {"status": "ok", "expenses": expenses}
-
-    @mcp.tool()
-    def get_expenses_by_date_range(start_date: str, end_date: str):
-        '''Retrieve expenses within a date range.'''
-        logger.debug("=== get_expenses_by_date_range called ===")
-        logger.debug(f"Connecting to database at: {DB_PATH}")
-        logger.debug(f"Database file exists: {DB_PATH.exists()}")
-        with sqlite3.connect(DB_PATH) as c:
-            c.row_factory = sqlite3.Row
-            cur = c.execute(
-                "SELECT * FROM expenses WHERE date BETWEEN ? AND ? ORDER BY date DESC", 
-                (start_date.lower(), end_date.lower())
+    @tool()
+    async def get_expenses_by_category(category: str, limit: int = DEFAULT_PAGE_SIZE, cursor: str | None = None,
+                                       columns: list[str] | None = None,
+                                       response_format: Format = "full", decimals: Decimals = None, omit_empty: OmitEmpty = False,
+                                       ledger: Ledger = None):
+        '''Retrieve expenses filtered by category, paginated like get_all_expenses.'''
+        logger.debug("=== get_expenses_by_category called: ledger=%s ===", ledger)
+        
+        def fetch(conn):
+            return paginate(conn, "category = ?", (category.lower(),), limit=limit, cursor=cursor, columns=columns, fmt=fmt)
+        
+        try:
+            db_path = ledgers.path(ledger)
+            fmt = parse_format(response_format, decimals, omit_empty)
+            if TRACE:
+                logger.debug("Connecting to database at: %s", db_path)
+                logger.debug("Database file exists: %s", db_path.exists())
+            page = await db_executor.read(db_path, fetch)
+            return {"status": "ok", **page}
+        except Exception as e:
+            logger.error("Error retrieving expenses by category: %s", e)
+            return {"status": "error", "message": str(e)}
+
+    @tool()
+    async def get_expenses_by_date_range(start_date: str, end_date: str, limit: int = DEFAULT_PAGE_SIZE, cursor: str | None = None,
+                                         columns: list[str] | None = None,
+                                         response_format: Format = "full", decimals: Decimals = None, omit_empty: OmitEmpty = False,
+                                         ledger: Ledger = None):
+        '''Retrieve expenses within a date range (inclusive), paginated like get_all_expenses.'''
+        logger.debug("=== get_expenses_by_date_range called: ledger=%s ===", ledger)
+        try:
+            db_path = ledgers.path(ledger)
+            if TRACE:
+                logger.debug("Connecting to database at: %s", db_path)
+                logger.debug("Database file exists: %s", db_path.exists())
+            bounds = (normalize_date(start_date), normalize_date(end_date))
+            fmt = parse_format(response_format, decimals, omit_empty)
+            page = await db_executor.read(
+                db_path, paginate, "date BETWEEN ? AND ?", bounds, limit, cursor, columns, fmt
             )
-            expenses = [dict(row) for row in cur.fetchall()]
-            return {"status": "ok", "expenses": expenses}
+            return {"status": "ok", **page}
+        except Exception as e:
+            logger.error("Error retrieving expenses by date range: %s", e)
+            return {"status": "error", "message": str(e)}
         
-    @mcp.tool()
-    def delete_expense_by_date_and_title(date:str, title:str):
+    @tool()
+    async def search_expenses(query: str, start_date: str | None = None, end_date: str | None = None,
+                              category: str | None = None, limit: int = DEFAULT_PAGE_SIZE,
+                              cursor: str | None = None, columns: list[str] | None = None,
+                              response_format: Format = "full", decimals: Decimals = None, omit_empty: OmitEmpty = False,
+                              ledger: Ledger = None):
+        '''Full-text search over note, subcategory and category, best matches first.
+        Words must all match; use "quoted words" for a phrase, a trailing * for a prefix (coff*) and OR between alternatives.
+        Optionally restrict to a date range (inclusive) and a category. Paginated like get_all_expenses.'''
+        logger.debug("=== search_expenses called: query=%s, category=%s, ledger=%s ===", query, category, ledger)
+        try:
+            db_path = ledgers.path(ledger)
+            fmt = parse_format(response_format, decimals, omit_empty)
+            conditions = []
+            params = []
+            if start_date:
+                conditions.append("e.date >= ?")
+                params.append(normalize_date(start_date))
+            if end_date:
+                conditions.append("e.date <= ?")
+                params.append(normalize_date(end_date))
+            if category:
+                conditions.append("e.category = ?")
+                params.append(category.lower())
+            page = await db_executor.read(
+                db_path, run_search, query, " AND ".join(conditions), params, limit, cursor, columns, fmt
+            )
+            return {"status": "ok", **page}
+        except Exception as e:
+            logger.error("Error searching expenses: %s", e)
+            return {"status": "error", "message": str(e)}
+
+    @tool()
+    async def delete_expense_by_date_and_title(date:str, title:str, ledger: Ledger = None):
         ''' Delete expense by date and title '''
-        with sqlite3.connect(DB_PATH) as conn:
-            conn.set_trace_callback(log_sql)
-            cur = conn.cursor()
-            cur.execute("Delete FROM expenses WHERE date = ? AND note = ?", (date.lower() , title.lower()))
-            deleted_rows = cur.rowcount
-            conn.commit()
-            logger.debug(f"{deleted_rows} rows have been deleted")
+        logger.debug("=== delete_expense_by_date_and_title called: date=%s, ledger=%s ===", date, ledger)
+        
+        def delete(conn):
+            # The connection is pooled, so only trace for the duration of this call
+            if TRACE:
+                conn.set_trace_callback(log_sql)
+            try:
+                cur = conn.cursor()
+                cur.execute("Delete FROM expenses WHERE date = ? AND note = ?", (date, title.lower()))
+                return cur.rowcount
+            finally:
+                if TRACE:
+                    conn.set_trace_callback(None)
+        
+        try:
+            db_path = ledgers.path(ledger)
+            date = normalize_date(date)
+            deleted_rows = await db_executor.write(db_path, delete)
+            if deleted_rows:
+                result_cache.invalidate([date[:7]], db_path)
+            logger.debug("%s rows have been deleted", deleted_rows)
             return {"status":"ok", "deleted_rows": deleted_rows}
+        except Exception as e:
+            logger.error("Error deleting expense: %s", e)
+            return {"status": "error", "message": str(e)}
+
+    @tool()
+    async def delete_expenses(ids: list[int] | None = None, start_date: str | None = None, end_date: str | None = None,
+                              category: str | None = None, subcategory: str | None = None, note: str | None = None,
+                              search: str | None = None, dry_run: bool = False, ledger: Ledger = None):
+        '''Delete many expenses in one transaction, chosen by a list of ids and/or filters
+        (inclusive date range, category, subcategory, exact note, full-text search like search_expenses).
+        At least one is required. dry_run=True only reports how many rows (and which ids) would be deleted.'''
+        logger.debug("=== delete_expenses called: ids=%s, start_date=%s, end_date=%s, category=%s, dry_run=%s ===",
+                     ids, start_date, end_date, category, dry_run)
+        try:
+            db_path = ledgers.path(ledger)
+            where, params = expense_filter(ids, start_date, end_date, category, subcategory, note, search)
+            if dry_run:
+                report = await db_executor.read(db_path, preview, where, params)
+            else:
+                report = await db_executor.write(db_path, delete_matching, where, params, timeout=BULK_TIMEOUT)
+                if report["matched"]:
+                    result_cache.invalidate(report["months"], db_path)
+            return {"status": "ok", "deleted": 0 if dry_run else report["matched"], **report}
+        except Exception as e:
+            logger.error("Error deleting expenses: %s", e)
+            return {"status": "error", "message": str(e)}
+
+    @tool()
+    async def update_expenses(ids: list[int] | None = None, start_date: str | None = None, end_date: str | None = None,
+                              category: str | None = None, subcategory: str | None = None, note: str | None = None,
+                              search: str | None = None, set_date: str | None = None, set_amount: float | None = None,
+                              set_category: str | None = None, set_subcategory: str | None = None,
+                              set_note: str | None = None, set_currency: str | None = None, dry_run: bool = False,
+                              ledger: Ledger = None):
+        '''Update many expenses in one transaction. Rows are chosen like delete_expenses (ids and/or filters);
+        the set_* fields give the new values. E.g. category="food", start_date="2024-05-01", end_date="2024-05-31",
+        set_category="groceries" recategorizes a month. dry_run=True only reports what would change.'''
+        logger.debug("=== update_expenses called: ids=%s, start_date=%s, end_date=%s, category=%s, dry_run=%s ===",
+                     ids, start_date, end_date, category, dry_run)
+        try:
+            db_path = ledgers.path(ledger)
+            where, params = expense_filter(ids, start_date, end_date, category, subcategory, note, search)
+            changes = normalize_changes(set_date, set_amount, set_category, set_subcategory, set_note, set_currency)
+            if dry_run:
+                report = await db_executor.read(db_path, preview, where, params)
+            else:
+                report = await db_executor.write(db_path, update_matching, where, params, changes, timeout=BULK_TIMEOUT)
+                if report["matched"]:
+                    result_cache.invalidate(report["months"], db_path)
+            return {"status": "ok", "updated": 0 if dry_run else report["matched"], "changes": changes, **report}
+        except Exception as e:
+            logger.error("Error updating expenses: %s", e)
+            return {"status": "error", "message": str(e)}
 
     # Analytics & Reporting Tools    
-    @mcp.tool()
-    def get_expense_summary(period: str = "all", category: str = None):
+    @tool()
+    async def get_expense_summary(period: str = "all", category: str = None, response_format: Format = "full",
+                                  decimals: Decimals = None, ledger: Ledger = None):
         '''Get expense summary with total spending. Period can be "all", "monthly", "yearly", or specific month/year.'''
-        logger.debug(f"=== get_expense_summary called: period={period}, category={category} ===")
+        logger.debug("=== get_expense_summary called: period=%s, category=%s ===", period, category)
         
         try:
-            with sqlite3.connect(DB_PATH) as conn:
-                conn.row_factory = sqlite3.Row
+            db_path = ledgers.path(ledger)
+            fmt = parse_format(response_format, decimals)
+            months = period_months(period)
+            
+            def fetch(conn):
                 cur = conn.cursor()
-                
+            
                 # Build query based on parameters
-                base_query = "SELECT SUM(amount) as total, COUNT(*) as count, AVG(amount) as average"
+                base_query = "SELECT SUM(total_cents) as total, SUM(count) as count"
                 where_conditions = []
                 params = []
-                
+            
                 if category:
                     where_conditions.append("category = ?")
                     params.append(category.lower())
-                
-                if period == "monthly":
-                    where_conditions.append("strftime('%Y-%m', date) = strftime('%Y-%m', 'now')")
-                elif period == "yearly":
-                    where_conditions.append("strftime('%Y', date) = strftime('%Y', 'now')")
-                elif period != "all":
-                    # Assume it's a specific month in YYYY-MM format
-                    where_conditions.append("strftime('%Y-%m', date) = ?")
-                    params.append(period)
-                
+            
+                period_clause, period_params = months_filter(months)
+                if period_clause:
+                    where_conditions.append(period_clause)
+                    params.extend(period_params)
+            
                 if where_conditions:
-                    query = f"{base_query} FROM expenses WHERE {' AND '.join(where_conditions)}"
+                    query = f"{base_query} FROM expense_rollups WHERE {' AND '.join(where_conditions)}"
                 else:
-                    query = f"{base_query} FROM expenses"
-                
+                    query = f"{base_query} FROM expense_rollups"
+            
                 cur.execute(query, params)
                 result = cur.fetchone()
-                
+            
                 # Get category breakdown if no specific category requested
                 category_breakdown = None
                 if not category:
-                    category_query = "SELECT category, SUM(amount) as total, COUNT(*) as count FROM expenses"
-                    if period == "monthly":
-                        category_query += " WHERE strftime('%Y-%m', date) = strftime('%Y-%m', 'now')"
-                    elif period == "yearly":
-                        category_query += " WHERE strftime('%Y', date) = strftime('%Y', 'now')"
-                    elif period != "all":
-                        category_query += " WHERE strftime('%Y-%m', date) = ?"
-                    
+                    category_query = "SELECT category, SUM(total_cents) as total, SUM(count) as count FROM expense_rollups"
+                    if period_clause:
+                        category_query += f" WHERE {period_clause}"
                     category_query += " GROUP BY category ORDER BY total DESC"
-                    
-                    cur.execute(category_query, params if period not in ["monthly", "yearly", "all"] else [])
-                    category_breakdown = [dict(row) for row in cur.fetchall()]
                 
+                    cur.execute(category_query, period_params)
+                    category_breakdown = [money(row, "total") for row in cur.fetchall()]
+            
                 return {
                     "status": "ok",
                     "summary": {
-                        "total_amount": result["total"] or 0,
+                        "total_amount": to_amount(result["total"] or 0),
                         "total_count": result["count"] or 0,
-                        "average_amount": result["average"] or 0,
+                        "average_amount": average_amount(result["total"], result["count"]),
                         "period": period,
                         "category": category
                     },
                     "category_breakdown": category_breakdown
                 }
+        
+            report = await result_cache.acached(
+                ("get_expense_summary", period, months, category.lower() if category else None),
+                months,
+                lambda: db_executor.read(db_path, fetch),
+                scope=db_path,
+            )
+            return compact_response(report, fmt)
                 
         except Exception as e:
-            logger.error(f"Error getting expense summary: {e}")
+            logger.error("Error getting expense summary: %s", e)
             return {"status": "error", "message": str(e)}
 
-    @mcp.tool()
-    def get_monthly_spending(year: int = None, month: int = None):
+    @tool()
+    async def get_monthly_spending(year: int = None, month: int = None, response_format: Format = "full", decimals: Decimals = None,
+                                   ledger: Ledger = None):
         '''Get spending for a specific month. If no parameters provided, returns current month.'''
-        logger.debug(f"=== get_monthly_spending called: year={year}, month={month} ===")
+        logger.debug("=== get_monthly_spending called: year=%s, month=%s ===", year, month)
         
         try:
-            with sqlite3.connect(DB_PATH) as conn:
-                conn.row_factory = sqlite3.Row
+            db_path = ledgers.path(ledger)
+            fmt = parse_format(response_format, decimals)
+            # Specific month requested, otherwise current month
+            date_filter = f"{year:04d}-{month:02d}" if year and month else "current"
+            months = period_months(date_filter)
+            
+            def fetch(conn):
                 cur = conn.cursor()
-                
-                if year and month:
-                    # Specific month requested
-                    date_filter = f"{year:04d}-{month:02d}"
-                    cur.execute("""
-                        SELECT 
-                            SUM(amount) as total,
-                            COUNT(*) as count,
-                            category,
-                            SUM(amount) as category_total
-                        FROM expenses 
-                        WHERE strftime('%Y-%m', date) = ?
-                        GROUP BY category
-                        ORDER BY category_total DESC
-                    """, (date_filter,))
-                else:
-                    # Current month
-                    cur.execute("""
-                        SELECT 
-                            SUM(amount) as total,
-                            COUNT(*) as count,
-                            category,
-                            SUM(amount) as category_total
-                        FROM expenses 
-                        WHERE strftime('%Y-%m', date) = strftime('%Y-%m', 'now')
-                        GROUP BY category
-                        ORDER BY category_total DESC
-                    """)
-                
+            
+                period_clause, params = months_filter(months)
+                cur.execute(f"""
+                    SELECT 
+                        SUM(total_cents) as total,
+                        SUM(count) as count,
+                        category,
+                        SUM(total_cents) as category_total
+                    FROM expense_rollups 
+                    WHERE {period_clause}
+                    GROUP BY category
+                    ORDER BY category_total DESC
+                """, params)
+            
                 results = cur.fetchall()
                 total_spending = sum(row["category_total"] for row in results)
-                
+            
                 return {
                     "status": "ok",
-                    "month": f"{year:04d}-{month:02d}" if year and month else "current",
-                    "total_spending": total_spending,
+                    "month": date_filter,
+                    "total_spending": to_amount(total_spending),
                     "total_transactions": sum(row["count"] for row in results),
-                    "category_breakdown": [dict(row) for row in results]
+                    "category_breakdown": [money(row, "total", "category_total") for row in results]
                 }
+        
+            report = await result_cache.acached(
+                ("get_monthly_spending", date_filter, months),
+                months,
+                lambda: db_executor.read(db_path, fetch),
+                scope=db_path,
+            )
+            return compact_response(report, fmt)
                 
         except Exception as e:
-            logger.error(f"Error getting monthly spending: {e}")
+            logger.error("Error getting monthly spending: %s", e)
             return {"status": "error", "message": str(e)}
 
-    @mcp.tool()
-    def get_category_totals(period: str = "all"):
+    @tool()
+    async def get_category_totals(period: str = "all", response_format: Format = "full", decimals: Decimals = None,
+                                  ledger: Ledger = None):
         '''Get total spending by category for a specific period.'''
-        logger.debug(f"=== get_category_totals called: period={period} ===")
+        logger.debug("=== get_category_totals called: period=%s ===", period)
         
         try:
-            with sqlite3.connect(DB_PATH) as conn:
-                conn.row_factory = sqlite3.Row
+            db_path = ledgers.path(ledger)
+            fmt = parse_format(response_format, decimals)
+            months = period_months(period)
+            
+            def fetch(conn):
                 cur = conn.cursor()
-                
+            
                 base_query = """
                     SELECT 
                         category,
-                        SUM(amount) as total,
-                        COUNT(*) as count,
-                        AVG(amount) as average,
-                        MIN(amount) as min_amount,
-                        MAX(amount) as max_amount
-                    FROM expenses
+                        SUM(total_cents) as total,
+                        SUM(count) as count,
+                        MIN(min_cents) as min_amount,
+                        MAX(max_cents) as max_amount
+                    FROM expense_rollups
                 """
-                
-                where_clause = ""
-                params = []
-                
-                if period == "monthly":
-                    where_clause = " WHERE strftime('%Y-%m', date) = strftime('%Y-%m', 'now')"
-                elif period == "yearly":
-                    where_clause = " WHERE strftime('%Y', date) = strftime('%Y', 'now')"
-                elif period != "all":
-                    where_clause = " WHERE strftime('%Y-%m', date) = ?"
-                    params.append(period)
-                
+            
+                period_clause, params = months_filter(months)
+                where_clause = f" WHERE {period_clause}" if period_clause else ""
+            
                 query = f"{base_query}{where_clause} GROUP BY category ORDER BY total DESC"
                 cur.execute(query, params)
-                
-                results = [dict(row) for row in cur.fetchall()]
-                total_all_categories = sum(row["total"] for row in results)
-                
+            
+                rows = cur.fetchall()
+                results = [
+                    {**money(row, "total", "min_amount", "max_amount"),
+                     "average": average_amount(row["total"], row["count"])}
+                    for row in rows
+                ]
+                total_all_categories = to_amount(sum(row["total"] for row in rows))
+            
                 return {
                     "status": "ok",
                     "period": period,
                     "total_all_categories": total_all_categories,
                     "categories": results
                 }
+        
+            report = await result_cache.acached(
+                ("get_category_totals", period, months),
+                months,
+                lambda: db_executor.read(db_path, fetch),
+                scope=db_path,
+            )
+            return compact_response(report, fmt)
                 
         except Exception as e:
-            logger.error(f"Error getting category totals: {e}")
+            logger.error("Error getting category totals: %s", e)
             return {"status": "error", "message": str(e)}
 
-    @mcp.tool()
-    def get_spending_trends(period1: str, period2: str):
-        '''Compare spending between two periods. Periods should be in YYYY-MM format or "current" for current month.'''
-        logger.debug(f"=== get_spending_trends called: period1={period1}, period2={period2} ===")
+    @tool()
+    async def get_spending_trends(period1: str | None = None, period2: str | None = None,
+                                  periods: list[str] | None = None, granularity: str = "month",
+                                  count: int = 12, end: str | None = None, window_days: int = 30,
+                                  moving_average: int = 3, response_format: Format = "full", decimals: Decimals = None,
+                                  ledger: Ledger = None):
+        '''Compare spending by category across periods in a single query.
+        Either pass period1 and period2 (YYYY-MM, YYYY, YYYY-Qn or "current") for a two-period comparison,
+        a list of periods, or let granularity ("month", "quarter", "year" or "rolling" windows of window_days)
+        and count pick the last N periods up to end (default today). Returns totals, deltas, percent
+        changes and a moving average over moving_average periods for every category and overall.'''
+        logger.debug("=== get_spending_trends called: period1=%s, period2=%s, periods=%s, granularity=%s, count=%s ===",
+                     period1, period2, periods, granularity, count)
         
         try:
-            with sqlite3.connect(DB_PATH) as conn:
-                conn.row_factory = sqlite3.Row
-                cur = conn.cursor()
-                
-                # Get data for period 1
-                if period1 == "current":
-                    cur.execute("""
-                        SELECT 
-                            SUM(amount) as total,
-                            COUNT(*) as count,
-                            category,
-                            SUM(amount) as category_total
-                        FROM expenses 
-                        WHERE strftime('%Y-%m', date) = strftime('%Y-%m', 'now')
-                        GROUP BY category
-                    """)
-                else:
-                    cur.execute("""
-                        SELECT 
-                            SUM(amount) as total,
-                            COUNT(*) as count,
-                            category,
-                            SUM(amount) as category_total
-                        FROM expenses 
-                        WHERE strftime('%Y-%m', date) = ?
-                        GROUP BY category
-                    """, (period1,))
-                
-                period1_data = {row["category"]: dict(row) for row in cur.fetchall()}
-                
-                # Get data for period 2
-                if period2 == "current":
-                    cur.execute("""
-                        SELECT 
-                            SUM(amount) as total,
-                            COUNT(*) as count,
-                            category,
-                            SUM(amount) as category_total
-                        FROM expenses 
-                        WHERE strftime('%Y-%m', date) = strftime('%Y-%m', 'now')
-                        GROUP BY category
-                    """)
-                else:
-                    cur.execute("""
-                        SELECT 
-                            SUM(amount) as total,
-                            COUNT(*) as count,
-                            category,
-                            SUM(amount) as category_total
-                        FROM expenses 
-                        WHERE strftime('%Y-%m', date) = ?
-                        GROUP BY category
-                    """, (period2,))
-                
-                period2_data = {row["category"]: dict(row) for row in cur.fetchall()}
-                
-                # Calculate trends
-                all_categories = set(period1_data.keys()) | set(period2_data.keys())
-                trends = []
-                
-                for category in all_categories:
-                    p1_data = period1_data.get(category, {"category_total": 0, "count": 0})
-                    p2_data = period2_data.get(category, {"category_total": 0, "count": 0})
-                    
-                    p1_total = p1_data["category_total"] or 0
-                    p2_total = p2_data["category_total"] or 0
-                    
-                    change_amount = p2_total - p1_total
-                    change_percentage = (change_amount / p1_total * 100) if p1_total > 0 else 0
-                    
-                    trends.append({
-                        "category": category,
-                        "period1_total": p1_total,
-                        "period2_total": p2_total,
-                        "change_amount": change_amount,
-                        "change_percentage": round(change_percentage, 2)
-                    })
-                
-                # Sort by absolute change amount
-                trends.sort(key=lambda x: abs(x["change_amount"]), reverse=True)
-                
-                total_p1 = sum(period1_data.values(), {}).get("total", 0) or sum(row["category_total"] for row in period1_data.values())
-                total_p2 = sum(period2_data.values(), {}).get("total", 0) or sum(row["category_total"] for row in period2_data.values())
-                
+            db_path = ledgers.path(ledger)
+            fmt = parse_format(response_format, decimals)
+            if period1 or period2:
+                if not (period1 and period2):
+                    raise ValueError("Both period1 and period2 are required")
+                resolved = [parse_period(period1), parse_period(period2)]
+            elif periods:
+                resolved = [parse_period(p) for p in periods]
+            else:
+                resolved = generate_periods(granularity, count, end, window_days)
+            months = covered_months(resolved)
+            
+            def fetch(conn):
+                trends = spending_trends(conn, resolved, moving_average)
+                if not period1:
+                    return {"status": "ok", **trends}
+                
+                # Two-period comparison keeps its original response shape
+                overall = trends["overall"]
+                total_p1, total_p2 = overall["totals"]
                 return {
                     "status": "ok",
                     "period1": period1,
                     "period2": period2,
-                    "total_change": total_p2 - total_p1,
-                    "total_change_percentage": round(((total_p2 - total_p1) / total_p1 * 100) if total_p1 > 0 else 0, 2),
-                    "trends": trends
+                    "total_change": overall["deltas"][1],
+                    "total_change_percentage": overall["percent_changes"][1] or 0,
+                    "trends": sorted((
+                        {
+                            "category": series["category"],
+                            "period1_total": series["totals"][0],
+                            "period2_total": series["totals"][1],
+                            "change_amount": series["deltas"][1],
+                            "change_percentage": series["percent_changes"][1] or 0,
+                        }
+                        for series in trends["categories"]
+                    ), key=lambda x: abs(x["change_amount"]), reverse=True),
+                    **trends,
                 }
+            
+            report = await result_cache.acached(
+                ("get_spending_trends", period1, period2, tuple(resolved), moving_average),
+                months,
+                lambda: db_executor.read(db_path, fetch),
+                scope=db_path,
+            )
+            return compact_response(report, fmt)
                 
         except Exception as e:
-            logger.error(f"Error getting spending trends: {e}")
+            logger.error("Error getting spending trends: %s", e)
             return {"status": "error", "message": str(e)}
 
-    @mcp.tool()
-    def get_top_categories(limit: int = 5, period: str = "all"):
+    @tool()
+    async def get_top_categories(limit: int = 5, period: str = "all", response_format: Format = "full", decimals: Decimals = None,
+                                 ledger: Ledger = None):
         '''Get top spending categories. Limit defaults to 5, period can be "all", "monthly", "yearly", or YYYY-MM.'''
-        logger.debug(f"=== get_top_categories called: limit={limit}, period={period} ===")
+        logger.debug("=== get_top_categories called: limit=%s, period=%s ===", limit, period)
         
         try:
-            with sqlite3.connect(DB_PATH) as conn:
-                conn.row_factory = sqlite3.Row
+            db_path = ledgers.path(ledger)
+            fmt = parse_format(response_format, decimals)
+            months = period_months(period)
+            
+            def fetch(conn):
                 cur = conn.cursor()
-                
+            
                 base_query = """
                     SELECT 
                         category,
-                        SUM(amount) as total,
-                        COUNT(*) as count,
-                        AVG(amount) as average
-                    FROM expenses
+                        SUM(total_cents) as total,
+                        SUM(count) as count
+                    FROM expense_rollups
                 """
-                
-                where_clause = ""
-                params = []
-                
-                if period == "monthly":
-                    where_clause = " WHERE strftime('%Y-%m', date) = strftime('%Y-%m', 'now')"
-                elif period == "yearly":
-                    where_clause = " WHERE strftime('%Y', date) = strftime('%Y', 'now')"
-                elif period != "all":
-                    where_clause = " WHERE strftime('%Y-%m', date) = ?"
-                    params.append(period)
-                
+            
+                period_clause, params = months_filter(months)
+                where_clause = f" WHERE {period_clause}" if period_clause else ""
+            
                 query = f"{base_query}{where_clause} GROUP BY category ORDER BY total DESC LIMIT ?"
                 params.append(limit)
-                
+            
                 cur.execute(query, params)
-                results = [dict(row) for row in cur.fetchall()]
-                
+                results = [
+                    {**money(row, "total"), "average": average_amount(row["total"], row["count"])}
+                    for row in cur.fetchall()
+                ]
+            
                 return {
                     "status": "ok",
                     "period": period,
                     "limit": limit,
                     "top_categories": results
                 }
+        
+            report = await result_cache.acached(
+                ("get_top_categories", period, months, limit),
+                months,
+                lambda: db_executor.read(db_path, fetch),
+                scope=db_path,
+            )
+            return compact_response(report, fmt)
                 
         except Exception as e:
-            logger.error(f"Error getting top categories: {e}")
-            return {"status": "error", "message": str(e)}
\ No newline at end of file
+            logger.error("Error getting top categories: %s", e)
+            return {"status": "error", "message": str(e)}
+
+    @tool()
+    async def add_recurring_expense(amount: float, category: str, frequency: str = "monthly",
+                                    start_date: str | None = None, interval: int = 1, end_date: str | None = None,
+                                    subcategory="", note="", currency: str | None = None, ledger: Ledger = None):
+        '''Add a recurring expense (rent, subscriptions, bills) that is entered automatically as it falls due.
+        frequency is "daily", "weekly", "monthly" or "yearly", every interval periods from start_date (default today)
+        until the optional end_date. Occurrences already due, e.g. from a past start_date, are entered right away.'''
+        logger.debug("=== add_recurring_expense called: %s for %s, %s from %s ===", amount, category, frequency, start_date)
+
+        try:
+            db_path = ledgers.path(ledger)
+            template = normalize_template(amount, category, frequency, start_date, interval, end_date,
+                                          subcategory, note, currency)
+            recurring_id = await db_executor.write(db_path, add_template, template)
+            report = await materialize_recurring(db_path)
+            logger.info("Added recurring expense %s", recurring_id)
+            return {"status": "ok", "id": recurring_id, "materialized": report["created"]}
+        except Exception as e:
+            logger.error("Error adding recurring expense: %s", e)
+            return {"status": "error", "message": str(e)}
+
+    @tool()
+    async def list_recurring_expenses(include_inactive: bool = False, ledger: Ledger = None):
+        '''List recurring expenses with their schedule and next due date.'''
+        logger.debug("=== list_recurring_expenses called: include_inactive=%s ===", include_inactive)
+
+        def fetch(conn):
+            where = "" if include_inactive else " WHERE active = 1"
+            recurring = []
+            for row in conn.execute(f"SELECT * FROM recurring_expenses{where} ORDER BY next_date IS NULL, next_date, id"):
+                entry = dict(row)
+                entry["amount"] = to_amount(entry.pop("amount_cents"))
+                entry["active"] = bool(entry["active"])
+                recurring.append(entry)
+            return recurring
+
+        try:
+            recurring = await db_executor.read(ledgers.path(ledger), fetch)
+            return {"status": "ok", "recurring_expenses": recurring}
+        except Exception as e:
+            logger.error("Error listing recurring expenses: %s", e)
+            return {"status": "error", "message": str(e)}
+
+    @tool()
+    async def cancel_recurring_expense(id: int, ledger: Ledger = None):
+        '''Stop a recurring expense. Expenses it already entered are kept.'''
+        logger.debug("=== cancel_recurring_expense called: id=%s ===", id)
+
+        def cancel(conn):
+            return conn.execute("UPDATE recurring_expenses SET active = 0 WHERE id = ? AND active = 1", (id,)).rowcount
+
+        try:
+            cancelled = await db_executor.write(ledgers.path(ledger), cancel)
+            return {"status": "ok", "cancelled": bool(cancelled)}
+        except Exception as e:
+            logger.error("Error cancelling recurring expense: %s", e)
+            return {"status": "error", "message": str(e)}
+
+    @tool()
+    async def materialize_recurring_expenses(until: str | None = None, ledger: Ledger = None):
+        '''Enter every recurring expense due on or before until (default today) now instead of waiting for the
+        scheduler. Safe to repeat: an occurrence is never entered twice.'''
+        logger.debug("=== materialize_recurring_expenses called: until=%s ===", until)
+        try:
+            report = await materialize_recurring(ledgers.path(ledger), until)
+            return {"status": "ok", **report}
+        except Exception as e:
+            logger.error("Error materializing recurring expenses: %s", e)
+            return {"status": "error", "message": str(e)}
+
+    @tool()
+    async def set_budget(category: str, monthly_amount: float, alert_percent: int = DEFAULT_ALERT_PERCENT,
+                         ledger: Ledger = None):
+        '''Set (or change) the monthly budget of a category. get_budget_status flags the category once
+        spending reaches alert_percent of it.'''
+        logger.debug("=== set_budget called: category=%s, monthly_amount=%s ===", category, monthly_amount)
+        try:
+            budget = normalize_budget(category, monthly_amount, alert_percent)
+            await db_executor.write(ledgers.path(ledger), save_budget, *budget)
+            return {"status": "ok", "category": budget[0], "monthly_amount": to_amount(budget[1]),
+                    "alert_percent": budget[2]}
+        except Exception as e:
+            logger.error("Error setting budget: %s", e)
+            return {"status": "error", "message": str(e)}
+
+    @tool()
+    async def remove_budget(category: str, ledger: Ledger = None):
+        '''Remove the monthly budget of a category.'''
+        logger.debug("=== remove_budget called: category=%s ===", category)
+        try:
+            removed = await db_executor.write(ledgers.path(ledger), remove_budget_row, category.strip().lower())
+            return {"status": "ok", "removed": bool(removed)}
+        except Exception as e:
+            logger.error("Error removing budget: %s", e)
+            return {"status": "error", "message": str(e)}
+
+    @tool()
+    async def get_budget_status(year: int = None, month: int = None, ledger: Ledger = None):
+        '''Spending against every category budget for a month (default the current month): spent, remaining,
+        percent used and a state of "ok", "warning" (past the alert threshold) or "over".
+        alerts lists the categories that are not ok.'''
+        logger.debug("=== get_budget_status called: year=%s, month=%s ===", year, month)
+        try:
+            db_path = ledgers.path(ledger)
+            months = period_months(f"{year:04d}-{month:02d}" if year and month else "current")
+            report = await db_executor.read(db_path, budget_status, months[0])
+            return {"status": "ok", **report}
+        except Exception as e:
+            logger.error("Error getting budget status: %s", e)
+            return {"status": "error", "message": str(e)}
+
+    @tool()
+    async def verify_rollups(repair: bool = False, ledger: Ledger = None):
+        '''Check the monthly rollup table against raw expenses. Set repair=True to rebuild it.'''
+        logger.debug("=== verify_rollups called: repair=%s ===", repair)
+        
+        try:
+            db_path = ledgers.path(ledger)
+            drift = await db_executor.read(db_path, check_rollups, timeout=BULK_TIMEOUT)
+            if drift and repair:
+                await db_executor.write(db_path, rebuild_rollups, timeout=BULK_TIMEOUT)
+                result_cache.invalidate(scope=db_path)
+                logger.info("Rebuilt rollups after finding %s drifted groups", len(drift))
+            return {
+                "status": "ok",
+                "drifted_groups": len(drift),
+                "repaired": bool(drift and repair),
+                "drift": drift[:50]
+            }
+        
+        except Exception as e:
+            logger.error("Error verifying rollups: %s", e)
+            return {"status": "error", "message": str(e)}
+
+    @tool()
+    async def rebuild_search_index(ledger: Ledger = None):
+        '''Rebuild the full-text search index from the expenses table (e.g. after restoring an old database file).'''
+        logger.debug("=== rebuild_search_index called ===")
+        try:
+            indexed = await db_executor.write(ledgers.path(ledger), run_search_rebuild, timeout=BULK_TIMEOUT)
+            return {"status": "ok", "indexed": indexed}
+        except Exception as e:
+            logger.error("Error rebuilding search index: %s", e)
+            return {"status": "error", "message": str(e)}
+
+    @tool()
+    async def export_snapshot(rebuild: bool = False, ledger: Ledger = None):
+        '''Write the expenses into a compact columnar snapshot file for analyze_snapshot.
+        Only expenses added since the last export are appended; it is rewritten after deletes or edits,
+        or when rebuild=True.'''
+        logger.debug("=== export_snapshot called: rebuild=%s, ledger=%s ===", rebuild, ledger)
+        try:
+            db_path = ledgers.path(ledger)
+            report = await asyncio.get_running_loop().run_in_executor(export_executor, export_database, db_path, rebuild)
+            return {"status": "ok", **report}
+        except Exception as e:
+            logger.error("Error exporting snapshot: %s", e)
+            return {"status": "error", "message": str(e)}
+
+    @tool()
+    async def analyze_snapshot(group_by: list[str] | None = None, start_date: str | None = None,
+                               end_date: str | None = None, category: str | None = None, limit: int = 100,
+                               refresh: bool = False, response_format: Format = "full", decimals: Decimals = None,
+                               ledger: Ledger = None):
+        '''Ad-hoc totals over the exported snapshot, fast even for tens of millions of expenses.
+        group_by is any of "category", "subcategory", "year", "month", "weekday" (default category, [] for one grand total);
+        optional date range (inclusive) and category filters. refresh=True exports new expenses first,
+        otherwise results are as of the last export_snapshot. Needs numpy.'''
+        logger.debug("=== analyze_snapshot called: group_by=%s, start_date=%s, end_date=%s, category=%s ===",
+                     group_by, start_date, end_date, category)
+        try:
+            db_path = ledgers.path(ledger)
+            fmt = parse_format(response_format, decimals)
+            if refresh:
+                await asyncio.get_running_loop().run_in_executor(export_executor, export_database, db_path)
+            # NumPy over memory-mapped files, no SQLite connection needed
+            group_by = ["category"] if group_by is None else group_by
+            report = await asyncio.to_thread(
+                analyze, snapshot_path(db_path), group_by, start_date, end_date, category, limit
+            )
+            return compact_response({"status": "ok", "group_by": group_by, **report}, fmt)
+        except Exception as e:
+            logger.error("Error analyzing snapshot: %s", e)
+            return {"status": "error", "message": str(e)}
+
+    @tool()
+    async def import_expenses(path: str, format: str | None = None, batch_size: int = DEFAULT_BATCH_SIZE,
+                              ledger: Ledger = None):
+        '''Bulk import expenses from a local CSV or JSONL file with date, amount, category, subcategory and note fields.
+        Format is taken from the file extension unless given. Invalid rows are skipped and reported.'''
+        logger.debug("=== import_expenses called: path=%s, format=%s, batch_size=%s ===", path, format, batch_size)
+        
+        try:
+            db_path = ledgers.path(ledger)
+            # The importer runs its own single transaction on the writer thread
+            report = await db_executor.write(
+                db_path, run_import, path, format, batch_size, own_transaction=True, timeout=BULK_TIMEOUT
+            )
+            if report["imported"]:
+                result_cache.invalidate(report["months"], db_path)
+            return {"status": "ok", **report}
+        
+        except Exception as e:
+            logger.error("Error importing expenses: %s", e)
+            return {"status": "error", "message": str(e)}
+
+    @tool()
+    async def aggregate_ledgers(period: str = "all", names: list[str] | None = None, top: int = 10,
+                                response_format: Format = "full", decimals: Decimals = None):
+        '''Admin: total spending across ledgers for a period ("all", "monthly", "yearly", YYYY or YYYY-MM).
+        Reads every ledger (or only the given names) in parallel and returns the overall total, the top
+        categories across ledgers and the top ledgers by spending. Ledgers that do not exist are listed, not created.'''
+        logger.debug("=== aggregate_ledgers called: period=%s, names=%s, top=%s ===", period, names, top)
+
+        try:
+            fmt = parse_format(response_format, decimals)
+            months = period_months(period)
+            selected = [ledgers.normalize(name) for name in names] if names else ledgers.names()
+            missing = [name for name in selected if not ledgers.exists(name)]
+            selected = [name for name in dict.fromkeys(selected) if name not in missing]
+
+            def fetch(conn):
+                period_clause, params = months_filter(months)
+                where_clause = f" WHERE {period_clause}" if period_clause else ""
+                return conn.execute(
+                    f"SELECT category, SUM(total_cents) as total, SUM(count) as count FROM expense_rollups{where_clause} GROUP BY category",
+                    params
+                ).fetchall()
+
+            results = await db_executor.read_many([ledgers.path(name) for name in selected], fetch)
+
+            categories = {}
+            by_ledger = []
+            failed = []
+            for name, rows in zip(selected, results):
+                if isinstance(rows, Exception):
+                    logger.error("Reading ledger %s failed: %s", name, rows)
+                    failed.append({"ledger": name, "message": str(rows)})
+                    continue
+                for row in rows:
+                    entry = categories.setdefault(row["category"], {"category": row["category"], "total": 0, "count": 0, "ledgers": 0})
+                    entry["total"] += row["total"]
+                    entry["count"] += row["count"]
+                    entry["ledgers"] += 1
+                by_ledger.append({
+                    "ledger": name,
+                    "total": sum(row["total"] for row in rows),
+                    "count": sum(row["count"] for row in rows),
+                })
+
+            total = sum(entry["total"] for entry in by_ledger)
+            count = sum(entry["count"] for entry in by_ledger)
+            top_categories = sorted(categories.values(), key=lambda x: x["total"], reverse=True)[:top]
+            top_ledgers = sorted(by_ledger, key=lambda x: x["total"], reverse=True)[:top]
+            return compact_response({
+                "status": "ok",
+                "period": period,
+                "ledgers": len(by_ledger),
+                "total_amount": to_amount(total),
+                "total_count": count,
+                "average_amount": average_amount(total, count),
+                "top_categories": [
+                    {**money(entry, "total"), "average": average_amount(entry["total"], entry["count"])}
+                    for entry in top_categories
+                ],
+                "top_ledgers": [money(entry, "total") for entry in top_ledgers],
+                "missing": missing,
+                "failed": failed,
+            }, fmt)
+
+        except Exception as e:
+            logger.error("Error aggregating ledgers: %s", e)
+            return {"status": "error", "message": str(e)}
+
+    @tool()
+    def get_cache_stats():
+        '''Hit/miss statistics and memory use of the analytics result cache.'''
+        return {"status": "ok", "cache": result_cache.stats()}
+
+    @tool()
+    def get_server_metrics(top: int = 20, reset: bool = False):
+        '''Per-tool call/error counts and latency percentiles, the slowest SQL statements
+        (by total time) and recent slow queries with their query plans.
+        When the server sets EXPENSE_TRACKER_METRICS_FILE, the metrics are also written there in Prometheus text format.'''
+        logger.debug("=== get_server_metrics called: top=%s ===", top)
+        try:
+            report = {"status": "ok", **metrics.snapshot(top), "cache": result_cache.stats(), "connections": pool.stats()}
+            # Only the operator-configured path: clients must not choose files for the server to replace
+            path = os.environ.get(METRICS_FILE_ENV)
+            if path:
+                cache = report["cache"]
+                report["prometheus_file"] = metrics.write_prometheus(path, {
+                    "cache_hits": cache["hits"],
+                    "cache_misses": cache["misses"],
+                    "cache_entries": cache["entries"],
+                    "cache_bytes": cache["bytes"],
+                    "open_connections": report["connections"]["open"],
+                })
+            if reset:
+                metrics.reset()
+            return report
+        except Exception as e:
+            logger.error("Error collecting metrics: %s", e)
+            return {"status": "error", "message": str(e)}
@@ -0,0 +1,169 @@
+import datetime
+from collections import namedtuple
+
+from .db import AMOUNT_CENTS, MINOR_UNITS, period_months, to_amount
+
+# Most periods compared in one call (each adds two result columns)
+MAX_PERIODS = 120
+
+GRANULARITIES = ("month", "quarter", "year", "rolling")
+
+# A half-open [start, end) date range
+Period = namedtuple("Period", "label start end")
+
+
+def _add_months(day, months):
+    index = day.year * 12 + day.month - 1 + months
+    return datetime.date(index // 12, index % 12 + 1, 1)
+
+
+def _month_period(first, last):
+    '''Period covering the inclusive YYYY-MM range (first, last).'''
+    start = datetime.date.fromisoformat(f"{first}-01")
+    end = _add_months(datetime.date.fromisoformat(f"{last}-01"), 1)
+    return start, end
+
+
+def parse_period(text, today=None):
+    '''Resolve one period label into a Period.
+
+    Accepts everything period_months() does except "all", plus "YYYY-Qn" and
+    explicit "YYYY-MM-DD..YYYY-MM-DD" date ranges (both ends inclusive).
+    '''
+    label = str(text).strip().lower()
+    if ".." in label:
+        first, last = (datetime.date.fromisoformat(part.strip()) for part in label.split("..", 1))
+        if last < first:
+            raise ValueError(f"Invalid period '{text}', range ends before it starts")
+        return Period(label, first, last + datetime.timedelta(days=1))
+    if len(label) == 7 and label[4:6] == "-q" and label[:4].isdigit() and label[6] in "1234":
+        start = datetime.date(int(label[:4]), 3 * int(label[6]) - 2, 1)
+        return Period(label.upper(), start, _add_months(start, 3))
+    if label == "all":
+        raise ValueError("Trends need bounded periods, 'all' is not supported")
+    return Period(label, *_month_period(*period_months(label, today)))
+
+
+def generate_periods(granularity="month", count=12, end=None, window_days=30):
+    '''The last count consecutive periods of the given granularity, oldest first, ending with the one containing end.'''
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"Invalid granularity '{granularity}', expected one of {list(GRANULARITIES)}")
+    if not 1 <= count <= MAX_PERIODS:
+        raise ValueError(f"count must be between 1 and {MAX_PERIODS}")
+    end = datetime.date.fromisoformat(end) if end else datetime.date.today()
+    periods = []
+    if granularity == "rolling":
+        window = datetime.timedelta(days=max(1, int(window_days)))
+        stop = end + datetime.timedelta(days=1)
+        for _ in range(count):
+            start = stop - window
+            periods.append(Period(f"{start.isoformat()}..{(stop - datetime.timedelta(days=1)).isoformat()}", start, stop))
+            stop = start
+    else:
+        step = {"month": 1, "quarter": 3, "year": 12}[granularity]
+        start = datetime.date(end.year, 1 if step == 12 else (end.month - 1) // step * step + 1, 1)
+        for _ in range(count):
+            if granularity == "month":
+                label = start.isoformat()[:7]
+            elif granularity == "quarter":
+                label = f"{start.year}-Q{(start.month - 1) // 3 + 1}"
+            else:
+                label = str(start.year)
+            periods.append(Period(label, start, _add_months(start, step)))
+            start = _add_months(start, -step)
+    return periods[::-1]
+
+
+def covered_months(periods):
+    '''Inclusive (first, last) YYYY-MM range spanning every period, for cache keys.'''
+    first = min(p.start for p in periods)
+    last = max(p.end for p in periods) - datetime.timedelta(days=1)
+    return first.isoformat()[:7], last.isoformat()[:7]
+
+
+def _month_aligned(periods):
+    return all(p.start.day == 1 and p.end.day == 1 for p in periods)
+
+
+def _series_query(periods):
+    '''One GROUP BY category with a conditional SUM per period.
+
+    Month-aligned periods read expense_rollups (primary key range on
+    year_month); anything else reads expenses over idx_expenses_date.
+    '''
+    columns = []
+    params = []
+    if _month_aligned(periods):
+        for i, p in enumerate(periods):
+            first = p.start.isoformat()[:7]
+            last = (p.end - datetime.timedelta(days=1)).isoformat()[:7]
+            columns.append(f"SUM(CASE WHEN year_month BETWEEN ? AND ? THEN total_cents ELSE 0 END) AS t{i}")
+            columns.append(f"SUM(CASE WHEN year_month BETWEEN ? AND ? THEN count ELSE 0 END) AS c{i}")
+            params += [first, last, first, last]
+        first, last = covered_months(periods)
+        source = "expense_rollups WHERE year_month BETWEEN ? AND ?"
+        params += [first, last]
+    else:
+        for i, p in enumerate(periods):
+            start, end = p.start.isoformat(), p.end.isoformat()
+            columns.append(f"SUM(CASE WHEN date >= ? AND date < ? THEN {AMOUNT_CENTS} ELSE 0 END) AS t{i}")
+            columns.append(f"SUM(CASE WHEN date >= ? AND date < ? THEN 1 ELSE 0 END) AS c{i}")
+            params += [start, end, start, end]
+        source = "expenses WHERE date >= ? AND date < ?"
+        params += [min(p.start for p in periods).isoformat(), max(p.end for p in periods).isoformat()]
+    return f"SELECT category, {', '.join(columns)} FROM {source} GROUP BY category", params
+
+
+def _changes(totals, window):
+    '''Period-over-period deltas, percent changes and a trailing moving average.
+
+    totals are integer cents; everything is computed on them and converted last.
+    '''
+    deltas = [None]
+    percent = [None]
+    for previous, current in zip(totals, totals[1:]):
+        deltas.append(to_amount(current - previous))
+        percent.append(round((current - previous) / previous * 100, 2) if previous else None)
+    moving = [
+        round(sum(totals[i + 1 - window:i + 1]) / window / MINOR_UNITS, 2) if i + 1 >= window else None
+        for i in range(len(totals))
+    ]
+    return {
+        "totals": [to_amount(t) for t in totals],
+        "deltas": deltas,
+        "percent_changes": percent,
+        "moving_average": moving,
+    }
+
+
+def spending_trends(conn, periods, moving_average=3):
+    '''Per-category and overall totals for every period, computed in one query.'''
+    if not periods:
+        raise ValueError("At least one period is required")
+    if len(periods) > MAX_PERIODS:
+        raise ValueError(f"Too many periods ({len(periods)}), at most {MAX_PERIODS}")
+    window = max(1, min(int(moving_average), len(periods)))
+
+    query, params = _series_query(periods)
+    n = len(periods)
+    overall_totals = [0] * n
+    overall_counts = [0] * n
+    series = []
+    for row in conn.execute(query, params):
+        values = tuple(row)
+        totals, counts = list(values[1::2]), list(values[2::2])
+        if not any(counts):
+            continue
+        for i in range(n):
+            overall_totals[i] += totals[i]
+            overall_counts[i] += counts[i]
+        series.append({"category": row["category"], "counts": counts, **_changes(totals, window)})
+    series.sort(key=lambda s: sum(s["totals"]), reverse=True)
+
+    return {
+        "periods": [{"label": p.label, "start": p.start.isoformat(),
+                     "end": (p.end - datetime.timedelta(days=1)).isoformat()} for p in periods],
+        "moving_average_window": window,
+        "overall": {"counts": overall_counts, **_changes(overall_totals, window)},
+        "categories": series,
+    }